@@ -1,23 +1,53 @@
 from argparse import _get_action_name
-from flask import Blueprint, Flask, abort, jsonify, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, Flask, Response, abort, g, jsonify, render_template, request, redirect, url_for, flash, session, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from markupsafe import escape
 from flask_migrate import Migrate
 from flask_mail import Mail, Message
 from flask_wtf.csrf import CSRFProtect
 from flask_login import LoginManager, UserMixin, current_user, login_user, logout_user, login_required
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
+import click
+import csv
+import io
 import pytz
 import uuid
 import os
+import json
+import hashlib
+import hmac
+import base64
+import binascii
+import smtplib
+import sqlite3
 import ssl
+import math
 import random
+import re
+import secrets
 import string
+import threading
+import time
+import queue
+import atexit
+import concurrent.futures
+import multiprocessing
+import tempfile
+from collections import Counter, OrderedDict, namedtuple
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 from config import Config
+from password_hashing import normalize_password_hash_method, verify_and_rehash_password
 
 app = Flask(__name__)
 app.config.from_object(Config)
+if app.config['PROXY_FIX_X_FOR']:
+    # 部署在反向代理之后时从X-Forwarded-For取客户端IP，否则所有请求的remote_addr都是代理地址
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
 app.config['WTF_CSRF_ENABLED'] = False  # 是否启用CSRF跨域保护，如果你不会配置，请不要开启！！！
 
 # 初始化扩展
@@ -98,6 +128,13 @@ class LicenseKey(db.Model):
     notes = db.Column(db.Text)
     
     project = db.relationship('Project', back_populates='license_keys')
+    
+    __table_args__ = (
+        db.Index('ix_license_key_project_id_key', 'project_id', 'key'),
+        db.Index('ix_license_key_project_id_is_active_expiry_time', 'project_id', 'is_active', 'expiry_time'),
+        db.Index('ix_license_key_is_active_expiry_time', 'is_active', 'expiry_time'),
+        db.Index('ix_license_key_project_id_created_at', 'project_id', 'created_at'),
+    )
 
     def calculate_expiry(self):
         if self.activation_time and self.duration_minutes:
@@ -112,6 +149,26 @@ class LicenseKey(db.Model):
         now = datetime.now(pytz.UTC) if self.expiry_time.tzinfo else datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
         return now > expiry_time
 
+    def get_status(self):
+        if self.is_banned:
+            return '已封禁'
+        if not self.is_active:
+            return '已禁用'
+        if self.activation_time:
+            return '已过期' if self.is_expired() else '已激活'
+        return '可用'
+
+    def to_api_dict(self, project_name):
+        return {
+            'status': self.get_status(),
+            'key': self.key,
+            'created_at': self.created_at.isoformat(),
+            'duration_minutes': self.duration_minutes,
+            'project_name': project_name,
+            'activation_time': self.activation_time.isoformat() if self.activation_time else None,
+            'expiry_time': self.expiry_time.isoformat() if self.expiry_time else None
+        }
+
 class Project(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     app_id = db.Column(db.String(36), unique=True, default=lambda: str(uuid.uuid4()))
@@ -121,6 +178,8 @@ class Project(db.Model):
     download_url = db.Column(db.String(255))
     announcement = db.Column(db.Text)
     force_update = db.Column(db.Boolean, default=False)
+    password_hash_method = db.Column(db.String(50))  # 项目用户密码哈希参数，为空时使用PROJECT_USER_HASH_METHOD
+    license_token_key = db.Column(db.String(64), default=lambda: generate_license_token_key())  # 签发离线卡密令牌的Ed25519私钥（base64url），只公开对应的公钥
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None))
     updated_at = db.Column(db.DateTime, onupdate=datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -139,7 +198,7 @@ class ProjectUser(db.Model):
     project_id = db.Column(db.Integer, db.ForeignKey('project.id', ondelete='CASCADE'), nullable=False)
     username = db.Column(db.String(50), nullable=False)
     email = db.Column(db.String(100), nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     nickname = db.Column(db.String(50))
     signature = db.Column(db.String(200))
     avatar = db.Column(db.String(255))
@@ -150,9 +209,18 @@ class ProjectUser(db.Model):
     last_login_ip = db.Column(db.String(45))
     reset_token = db.Column(db.String(64))
     reset_token_expires = db.Column(db.DateTime)
+    session_generation = db.Column(db.Integer, nullable=False, default=0)  # 会话代数，吊销全部会话令牌时加一，签发的令牌携带当前值
     
     project = db.relationship('Project', backref=db.backref('users', lazy=True))
     
+    __table_args__ = (
+        db.Index('ix_project_user_project_id_username', 'project_id', 'username'),
+        db.Index('ix_project_user_project_id_email', 'project_id', 'email'),
+        db.Index('ix_project_user_project_id_uid', 'project_id', 'uid'),
+        db.Index('ix_project_user_reset_token', 'reset_token'),
+        db.Index('ix_project_user_project_id_created_at', 'project_id', 'created_at'),
+    )
+    
     def __init__(self, **kwargs):
         super(ProjectUser, self).__init__(**kwargs)
         if not self.uid:
@@ -163,10 +231,16 @@ class ProjectUser(db.Model):
         return ''.join([random.choice(chars) for _ in range(12)])
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        project = db.session.get(Project, self.project_id)
+        self.password_hash = password_hasher.hash(password, get_password_hash_method(project))
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """校验密码，哈希参数与项目当前配置不一致时更新为新哈希（由调用方提交）"""
+        project = db.session.get(Project, self.project_id)
+        valid, new_hash = password_hasher.verify(self.password_hash, password, get_password_hash_method(project))
+        if new_hash:
+            self.password_hash = new_hash
+        return valid
     
     def generate_reset_token(self):
         self.reset_token = str(uuid.uuid4())
@@ -179,6 +253,18 @@ class ProjectUser(db.Model):
             return False
         return self.reset_token == token and datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None) < self.reset_token_expires
 
+class ProjectUserTokenRevocation(db.Model):
+    """
+    项目用户会话令牌吊销记录：jti不为空时吊销单个令牌（jti唯一，刷新令牌靠写入冲突保证只能使用一次），
+    jti为空时吊销该用户会话代数小于generation的全部令牌，expires_at之后记录可清理
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(32), index=True, unique=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    generation = db.Column(db.Integer)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None))
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
 class ApiCallLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -187,6 +273,124 @@ class ApiCallLog(db.Model):
     ip_address = db.Column(db.String(45))
 
     user = db.relationship('User', backref=db.backref('api_calls', lazy=True))
+    
+    __table_args__ = (
+        db.Index('ix_api_call_log_user_id_called_at', 'user_id', 'called_at'),
+        db.Index('ix_api_call_log_user_id_endpoint', 'user_id', 'endpoint'),
+    )
+
+class HourlyStat(db.Model):
+    """按开发者、按小时（北京时间）预聚合的API调用次数和卡密激活次数"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    hour = db.Column(db.DateTime, nullable=False)
+    api_calls = db.Column(db.Integer, nullable=False, default=0)
+    activations = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'hour', name='uq_hourly_stat_user_hour'),
+    )
+
+class ApiCallSummary(db.Model):
+    """超过保留期的API调用日志按开发者、接口和小时（UTC，与ApiCallLog.called_at一致）压缩后的计数"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    endpoint = db.Column(db.String(100), nullable=False)
+    hour = db.Column(db.DateTime, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'endpoint', 'hour', name='uq_api_call_summary_user_endpoint_hour'),
+    )
+
+class LicenseGenerationJob(db.Model):
+    """后台批量生成卡密的任务，generated随每批提交更新，供控制台显示进度"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id', ondelete='CASCADE'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    generated = db.Column(db.Integer, nullable=False, default=0)
+    duration_minutes = db.Column(db.Integer, nullable=False)
+    notes = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending/running/completed/failed
+    error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None))
+    finished_at = db.Column(db.DateTime)
+    
+    project = db.relationship('Project')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'project_id': self.project_id,
+            'project_name': self.project.name if self.project else None,
+            'quantity': self.quantity,
+            'generated': self.generated,
+            'progress': round(self.generated * 100 / self.quantity, 1) if self.quantity else 100,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None
+        }
+
+class OutboundEmail(db.Model):
+    """待发送邮件队列及发送结果，由后台线程领取发送"""
+    id = db.Column(db.Integer, primary_key=True)
+    category = db.Column(db.String(30), nullable=False)  # verification/reset_code/project_user_reset
+    recipient = db.Column(db.String(100), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending/sending/sent/failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None))
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None))
+    sent_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_outbound_email_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+class EmailCampaign(db.Model):
+    """
+    向项目用户群发公告邮件的任务，按用户ID顺序分批发送，last_user_id记录已处理到的位置；
+    发送线程用条件UPDATE写入claimed_by领取任务并定期更新heartbeat_at，同一任务只会有一个线程在发送
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id', ondelete='CASCADE'), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    search = db.Column(db.String(100))  # 收件人筛选条件，与用户列表的搜索和状态筛选相同
+    user_status = db.Column(db.String(20))
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending/running/completed/failed/cancelled
+    total = db.Column(db.Integer, nullable=False, default=0)
+    sent = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    last_user_id = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String(255))
+    claimed_by = db.Column(db.String(32))  # 正在发送的线程标识
+    heartbeat_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None))
+    finished_at = db.Column(db.DateTime)
+    
+    project = db.relationship('Project')
+    
+    def to_dict(self):
+        processed = self.sent + self.failed
+        return {
+            'id': self.id,
+            'project_id': self.project_id,
+            'subject': self.subject,
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed,
+            'progress': round(processed * 100 / self.total, 1) if self.total else (100 if self.status == 'completed' else 0),
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None
+        }
 
 class Report(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -208,100 +412,1824 @@ def inject_globals():
         'pytz': pytz
     }
 
-# 辅助函数
-def generate_license_key(length=16):
-    chars = string.ascii_uppercase + string.digits
-    return ''.join(random.choice(chars) for _ in range(length))
+# 辅助函数
+LICENSE_KEY_CHARS = string.ascii_uppercase + string.digits
+# 随机字节按值取模映射到卡密字符；丢弃末尾256 % 36个字节值，保证每个字符等概率
+LICENSE_KEY_TRANSLATION = bytes(ord(LICENSE_KEY_CHARS[value % len(LICENSE_KEY_CHARS)]) for value in range(256))
+LICENSE_KEY_REJECTED_BYTES = bytes(range(256 - 256 % len(LICENSE_KEY_CHARS), 256))
+
+def generate_license_key(length=16):
+    return generate_license_keys(1, length)[0]
+
+def generate_license_keys(count, length=16):
+    """一次读取足量CSPRNG随机字节生成count个互不相同的卡密"""
+    keys = set()
+    while len(keys) < count:
+        missing = count - len(keys)
+        chars = bytearray()
+        while len(chars) < missing * length:
+            chars += secrets.token_bytes(missing * length + missing * length // 32 + 16)\
+                .translate(None, LICENSE_KEY_REJECTED_BYTES)
+        text = chars.translate(LICENSE_KEY_TRANSLATION).decode('ascii')
+        keys.update(text[start:start + length] for start in range(0, missing * length, length))
+    return list(keys)
+
+def insert_license_keys(project_id, count, duration_minutes, notes=None, on_progress=None):
+    """
+    为项目批量生成并插入count个卡密。每批剔除库中已存在的卡密后批量INSERT并提交；
+    与并发写入发生唯一约束冲突时回滚并重新生成该批。on_progress(已插入数)在每批提交前调用，
+    与该批卡密在同一事务中提交。返回插入的卡密数
+    """
+    chunk_size = app.config['LICENSE_GENERATION_CHUNK_SIZE']
+    lookup_size = app.config['LICENSE_BATCH_CHUNK_SIZE']
+    created_at = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+    inserted = 0
+    conflicts = 0
+    while inserted < count:
+        keys = generate_license_keys(min(chunk_size, count - inserted))
+        existing = set()
+        for start in range(0, len(keys), lookup_size):
+            existing.update(row.key for row in db.session.query(LicenseKey.key)
+                .filter(LicenseKey.key.in_(keys[start:start + lookup_size])))
+        rows = [{
+            'key': key,
+            'project_id': project_id,
+            'duration_minutes': duration_minutes,
+            'notes': notes,
+            'created_at': created_at
+        } for key in keys if key not in existing]
+        if not rows:
+            continue
+        
+        try:
+            db.session.execute(db.insert(LicenseKey), rows)
+            if on_progress:
+                on_progress(inserted + len(rows))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            conflicts += 1
+            if conflicts > 3:
+                raise
+            continue
+        inserted += len(rows)
+    return inserted
+
+def calculate_duration_minutes(duration_value, duration_unit):
+    """将各种时间单位转换为分钟"""
+    duration_value = max(1, int(duration_value))
+    
+    if duration_unit == 'minutes':
+        return duration_value
+    elif duration_unit == 'hours':
+        return duration_value * 60
+    elif duration_unit == 'days':
+        return duration_value * 60 * 24
+    elif duration_unit == 'months':
+        return duration_value * 60 * 24 * 30  # 按30天算一个月
+    else:
+        return duration_value  # 默认按分钟
+
+class TTLCache:
+    """带容量上限的线程安全LRU/TTL缓存，记录命中、未命中和淘汰次数"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_matching(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+# 按app_id缓存序列化后的项目数据
+project_cache = TTLCache(
+    maxsize=app.config['PROJECT_CACHE_SIZE'],
+    ttl=app.config['PROJECT_CACHE_TTL']
+)
+
+# 按(app_id, dev_id)缓存已通过鉴权的项目
+project_auth_cache = TTLCache(
+    maxsize=app.config['PROJECT_CACHE_SIZE'],
+    ttl=app.config['PROJECT_AUTH_CACHE_TTL']
+)
+
+AuthorizedProject = namedtuple('AuthorizedProject', ['id', 'app_id', 'name', 'user_id'])
+
+def serialize_project(project):
+    updated_at = project.updated_at or project.created_at
+    payload = {
+        'id': project.id,
+        'name': project.name,
+        'created_at': project.created_at.strftime('%Y-%m-%d %H:%M:%S') if project.created_at else '',
+        'latest_version': project.latest_version,
+        'download_url': project.download_url,
+        'announcement': project.announcement,
+        'force_update': project.force_update,
+        'user_id': project.user_id,
+        'updated_at': updated_at.isoformat() if updated_at else ''
+    }
+    # 由更新时间和字段集合生成强ETag，任一字段变化都会改变ETag
+    payload['etag'] = hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+    return payload
+
+def make_cacheable_response(response_data, etag):
+    """生成带ETag和Cache-Control的响应，If-None-Match匹配时返回304"""
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(response_data)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['PROJECT_HTTP_MAX_AGE']
+    return response
+
+def resolve_authorized_project(app_id, dev_id):
+    """
+    校验dev_id是否为项目所有者，返回(project, error)。
+    项目与所有者的dev_id通过一次联表查询获取，鉴权成功的结果短时间缓存；
+    error为404表示项目不存在，为403表示无权限访问
+    """
+    project = project_auth_cache.get((app_id, dev_id))
+    if project:
+        g.api_user_id = project.user_id
+        return project, None
+    
+    row = db.session.query(Project.id, Project.name, Project.user_id, User.dev_id)\
+        .join(User, Project.user_id == User.id)\
+        .filter(Project.app_id == app_id)\
+        .first()
+    if not row:
+        return None, 404
+    if row.dev_id != dev_id:
+        return None, 403
+    
+    project = AuthorizedProject(id=row.id, app_id=app_id, name=row.name, user_id=row.user_id)
+    project_auth_cache.set((app_id, dev_id), project)
+    g.api_user_id = project.user_id
+    return project, None
+
+def invalidate_project_caches(app_id):
+    project_cache.invalidate(app_id)
+    project_auth_cache.invalidate_matching(lambda key: key[0] == app_id)
+
+def get_cached_project(app_id):
+    """从缓存读取项目数据，未命中时查询数据库并回填"""
+    payload = project_cache.get(app_id)
+    if payload is None:
+        project = Project.query.filter_by(app_id=app_id).first()
+        if not project:
+            return None
+        payload = serialize_project(project)
+        project_cache.set(app_id, payload)
+    return payload
+
+def parse_version(version):
+    """将版本号解析为可比较的元组，兼容v前缀、缺省位和预发布后缀（如1.2.0-beta.1）"""
+    version = (version or '').strip().lstrip('vV').split('+', 1)[0]
+    release, _, prerelease = version.partition('-')
+    
+    numbers = []
+    for part in release.split('.'):
+        digits = ''
+        for char in part:
+            if not char.isdigit():
+                break
+            digits += char
+        numbers.append(int(digits) if digits else 0)
+    # 1.0 与 1.0.0 视为同一版本
+    while len(numbers) > 1 and numbers[-1] == 0:
+        numbers.pop()
+    
+    # 正式版高于同号的预发布版；预发布标识中数字段低于字母段
+    identifiers = tuple(
+        (0, int(part), '') if part.isdigit() else (1, 0, part)
+        for part in prerelease.split('.')
+    ) if prerelease else ()
+    return (tuple(numbers), 0 if prerelease else 1, identifiers)
+
+def compare_versions(a, b):
+    """比较两个版本号，a<b返回-1，相等返回0，a>b返回1"""
+    a, b = parse_version(a), parse_version(b)
+    return (a > b) - (a < b)
+
+def parse_request_keys(data):
+    """从请求中解析卡密列表，支持JSON数组或以逗号/换行分隔的字符串，去重并保持顺序"""
+    keys = data.get('keys')
+    if isinstance(keys, str):
+        keys = keys.replace('\n', ',').split(',')
+    return list(dict.fromkeys(k.strip() for k in keys or [] if isinstance(k, str) and k.strip()))
+
+def encode_cursor(values):
+    return base64url_encode(json.dumps(values, default=lambda value: value.isoformat()).encode())
+
+def decode_cursor(cursor, columns):
+    """解码分页游标，按列类型还原时间值，游标无效时抛出ValueError"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if len(values) != len(columns):
+            raise ValueError
+        return [
+            datetime.fromisoformat(value) if isinstance(column.type, db.DateTime) and value is not None else value
+            for column, value in zip(columns, values)
+        ]
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError('无效的分页参数')
+
+def keyset_paginate(query, sort_column, id_column, descending, per_page, after=None, before=None):
+    """
+    按(sort_column, id_column)做键集分页，after/before为上一页末行或下一页首行的游标。
+    不使用OFFSET，翻到任意深度都只读取per_page + 1行。返回(items, prev_cursor, next_cursor)
+    """
+    columns = [sort_column, id_column]
+    backward = bool(before) and not after
+    cursor = decode_cursor(after or before, columns) if (after or before) else None
+    # 向前翻页时反向排序再倒转结果
+    reverse = descending != backward
+    
+    if cursor:
+        value, row_id = cursor
+        if reverse:
+            condition = db.or_(sort_column < value, db.and_(sort_column == value, id_column < row_id))
+        else:
+            condition = db.or_(sort_column > value, db.and_(sort_column == value, id_column > row_id))
+        query = query.filter(condition)
+    order = [sort_column.desc(), id_column.desc()] if reverse else [sort_column.asc(), id_column.asc()]
+    items = query.order_by(*order).limit(per_page + 1).all()
+    
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if backward:
+        items.reverse()
+    
+    def item_cursor(item):
+        return encode_cursor([getattr(item, column.key) for column in columns])
+    
+    prev_cursor = next_cursor = None
+    if items:
+        if backward:
+            prev_cursor = item_cursor(items[0]) if has_more else None
+            next_cursor = item_cursor(items[-1])
+        else:
+            prev_cursor = item_cursor(items[0]) if cursor else None
+            next_cursor = item_cursor(items[-1]) if has_more else None
+    return items, prev_cursor, next_cursor
+
+def sql_add_minutes(moment, minutes):
+    """生成“时间 + N分钟”的SQL表达式，按数据库方言选择对应的函数"""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return db.func.datetime(moment, db.literal('+') + db.cast(minutes, db.String) + ' minutes')
+    if dialect in ('mysql', 'mariadb'):
+        return db.func.timestampadd(db.literal_column('MINUTE'), minutes, moment)
+    return moment + db.func.make_interval(0, 0, 0, 0, 0, minutes)
+
+def truncate_to_hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def utc_to_beijing(moment):
+    """将UTC时间（无时区，如ApiCallLog.called_at）转换为北京时间（无时区）"""
+    return pytz.UTC.localize(moment).astimezone(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+
+def upsert_counters(model, key_columns, rows, columns):
+    """
+    批量累加计数：按key_columns唯一约束插入rows，已存在的行把columns列加上新值，
+    使用数据库的upsert语法一条语句完成；调用方负责提交事务
+    """
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    if dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(model).values(rows)
+        statement = statement.on_duplicate_key_update({
+            column: getattr(model, column) + statement.inserted[column] for column in columns
+        })
+    else:
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(model).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={column: getattr(model, column) + statement.excluded[column] for column in columns}
+        )
+    db.session.execute(statement)
+
+def increment_hourly_stats(column, counts):
+    """按{(user_id, hour): 数量}累加小时统计的指定列"""
+    upsert_counters(HourlyStat, ['user_id', 'hour'], [
+        {'user_id': user_id, 'hour': hour, 'api_calls': 0, 'activations': 0, column: count}
+        for (user_id, hour), count in counts.items()
+    ], [column])
+
+def record_activations(user_id, activation_time, count=1):
+    increment_hourly_stats('activations', {(user_id, truncate_to_hour(activation_time)): count})
+
+def activate_license_atomically(key, project_id, user_id):
+    """
+    用一条条件UPDATE激活卡密，只有未封禁、已启用且未激活的卡密会被更新，
+    并发请求中只有一个能成功。成功时返回包含duration_minutes、activation_time和expiry_time的行，否则返回None
+    """
+    now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None, microsecond=0)
+    statement = db.update(LicenseKey)\
+        .where(
+            LicenseKey.key == key,
+            LicenseKey.project_id == project_id,
+            # 早期导入的卡密is_banned可能为NULL，与逐行判断时一样视为未封禁
+            db.or_(LicenseKey.is_banned == False, LicenseKey.is_banned.is_(None)),
+            LicenseKey.is_active == True,
+            LicenseKey.activation_time.is_(None)
+        )\
+        .values(
+            activation_time=now,
+            expiry_time=sql_add_minutes(now, LicenseKey.duration_minutes)
+        )\
+        .execution_options(synchronize_session=False)
+    
+    # 支持RETURNING的数据库一次往返即可拿到结果，否则仅在更新成功后补一次查询
+    if db.engine.dialect.update_returning:
+        row = db.session.execute(
+            statement.returning(LicenseKey.duration_minutes, LicenseKey.activation_time, LicenseKey.expiry_time)
+        ).first()
+    elif db.session.execute(statement).rowcount == 1:
+        row = db.session.query(LicenseKey.duration_minutes, LicenseKey.activation_time, LicenseKey.expiry_time)\
+            .filter(LicenseKey.key == key).first()
+    else:
+        row = None
+    if row:
+        record_activations(user_id, now)
+    db.session.commit()
+    return row
+
+def base64url_encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def to_timestamp(moment):
+    """将数据库中的北京时间（无时区）转换为Unix时间戳"""
+    return int(pytz.timezone('Asia/Shanghai').localize(moment).timestamp())
+
+# 随仓库分发的默认SECRET_KEY，使用时任何人都能算出派生的签名密钥，不签发令牌
+DEFAULT_SECRET_KEYS = {'', 'dev-key-123'}
+
+def token_signing_enabled():
+    return app.config['SECRET_KEY'] not in DEFAULT_SECRET_KEYS
+
+def derive_token_secret(purpose):
+    """由SECRET_KEY按用途派生出独立的令牌签名密钥"""
+    return hmac.new(
+        app.config['SECRET_KEY'].encode('utf-8'),
+        purpose.encode('utf-8'),
+        hashlib.sha256
+    ).digest()
+
+def generate_license_token_key():
+    return base64url_encode(Ed25519PrivateKey.generate().private_bytes_raw())
+
+def base64url_decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+# 按app_id缓存项目的卡密令牌签名私钥，与project_cache分开，避免私钥进入对外返回的项目数据
+license_signing_key_cache = TTLCache(
+    maxsize=app.config['PROJECT_CACHE_SIZE'],
+    ttl=app.config['PROJECT_CACHE_TTL']
+)
+
+def get_license_signing_key(app_id):
+    """返回项目的Ed25519签名私钥，项目不存在或尚未生成密钥（未执行数据库迁移）时返回None"""
+    private_key = license_signing_key_cache.get(app_id)
+    if private_key is None:
+        encoded = db.session.query(Project.license_token_key).filter(Project.app_id == app_id).scalar()
+        if not encoded:
+            return None
+        private_key = Ed25519PrivateKey.from_private_bytes(base64url_decode(encoded))
+        license_signing_key_cache.set(app_id, private_key)
+    return private_key
+
+def get_session_token_secret(app_id):
+    """每个项目独立的项目用户会话令牌签名密钥，仅服务端持有"""
+    return derive_token_secret(f'project-user-session:{app_id}')
+
+def encode_token_parts(algorithm, payload):
+    header = {'alg': algorithm, 'typ': 'JWT'}
+    return '.'.join(
+        base64url_encode(json.dumps(part, separators=(',', ':')).encode('utf-8'))
+        for part in (header, payload)
+    )
+
+def sign_token(secret, payload):
+    """生成HS256格式（JWT）的令牌，只用于由服务端自己校验的令牌"""
+    signing_input = encode_token_parts('HS256', payload)
+    signature = hmac.new(secret, signing_input.encode('ascii'), hashlib.sha256).digest()
+    return f'{signing_input}.{base64url_encode(signature)}'
+
+def decode_token(secret, token):
+    """校验HS256令牌的签名和有效期并返回载荷，令牌无效或已过期时抛出ValueError"""
+    try:
+        signing_input, signature = token.rsplit('.', 1)
+        payload_part = signing_input.split('.')[1]
+        expected = base64url_encode(hmac.new(secret, signing_input.encode('ascii'), hashlib.sha256).digest())
+    except (AttributeError, IndexError, ValueError, UnicodeEncodeError):
+        raise ValueError('令牌无效')
+    if not hmac.compare_digest(expected, signature):
+        raise ValueError('令牌无效')
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(payload_part + '=' * (-len(payload_part) % 4)))
+    except (binascii.Error, ValueError):
+        raise ValueError('令牌无效')
+    if not isinstance(payload, dict) or not isinstance(payload.get('exp'), int):
+        raise ValueError('令牌无效')
+    if payload['exp'] <= time.time():
+        raise ValueError('令牌已过期')
+    return payload
+
+license_token_warning_logged = False
+
+def issue_license_token(app_id, key, activation_time, expiry_time):
+    """
+    签发EdDSA（Ed25519）签名的JWT格式离线卡密令牌，客户端用tokenKey接口公开的项目公钥在本地校验，
+    持有公钥无法伪造令牌；令牌有效期不超过卡密过期时间和LICENSE_TOKEN_TTL，过期后需重新获取。
+    SECRET_KEY为默认值或项目尚无签名密钥时不签发，返回None
+    """
+    global license_token_warning_logged
+    private_key = get_license_signing_key(app_id) if token_signing_enabled() else None
+    if private_key is None:
+        if not license_token_warning_logged:
+            license_token_warning_logged = True
+            app.logger.warning('SECRET_KEY为默认值或项目缺少令牌签名密钥（请执行flask db upgrade），不签发离线卡密令牌')
+        return None
+    
+    now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+    token_expiry = min(expiry_time, now + timedelta(seconds=app.config['LICENSE_TOKEN_TTL']))
+    signing_input = encode_token_parts('EdDSA', {
+        'key': key,
+        'app_id': app_id,
+        'activation_time': activation_time.isoformat(),
+        'expiry_time': expiry_time.isoformat(),
+        'iat': to_timestamp(now),
+        'exp': to_timestamp(token_expiry)
+    })
+    return f'{signing_input}.{base64url_encode(private_key.sign(signing_input.encode("ascii")))}'
+
+class SessionTokenDenylist:
+    """
+    项目用户会话令牌的内存吊销名单，每隔refresh_interval秒从ProjectUserTokenRevocation重新加载，
+    校验令牌时不访问数据库；本进程内的吊销立即生效，其他进程最迟在下次加载后生效
+    """
+
+    def __init__(self, refresh_interval=30):
+        self.refresh_interval = refresh_interval
+        self.loaded_at = None
+        self._jtis = set()
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def _reload(self):
+        now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+        rows = db.session.query(
+            ProjectUserTokenRevocation.jti,
+            ProjectUserTokenRevocation.user_id,
+            ProjectUserTokenRevocation.generation
+        ).filter(ProjectUserTokenRevocation.expires_at > now).all()
+        
+        jtis = set()
+        users = {}
+        for jti, user_id, generation in rows:
+            if jti:
+                jtis.add(jti)
+            else:
+                users[user_id] = max(users.get(user_id, 0), generation or 0)
+        self._jtis, self._users = jtis, users
+
+    def _ensure_fresh(self):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.refresh_interval:
+            return
+        # 只由一个线程重新加载，其余线程继续使用现有名单
+        if not self._lock.acquire(blocking=self.loaded_at is None):
+            return
+        try:
+            if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.refresh_interval:
+                try:
+                    self._reload()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f'加载令牌吊销名单失败: {str(e)}')
+                self.loaded_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def is_revoked(self, claims):
+        self._ensure_fresh()
+        # 按会话代数而不是签发时间判断，同一秒内吊销后重新登录签发的令牌不受影响
+        return claims.get('jti') in self._jtis or claims.get('gen', 0) < self._users.get(claims.get('sub'), 0)
+
+    def add_token(self, jti):
+        self._jtis.add(jti)
+
+    def add_user(self, user_id, generation):
+        self._users[user_id] = max(self._users.get(user_id, 0), generation)
+
+    def stats(self):
+        return {
+            'tokens': len(self._jtis),
+            'users': len(self._users),
+            'refresh_interval': self.refresh_interval
+        }
+
+session_token_denylist = SessionTokenDenylist(
+    refresh_interval=app.config['PROJECT_USER_DENYLIST_REFRESH']
+)
+
+def issue_session_tokens(app_id, user):
+    """为项目用户签发访问令牌和刷新令牌，SECRET_KEY为默认值时不签发，返回空字典"""
+    if not token_signing_enabled():
+        return {}
+    now = int(time.time())
+    claims = {
+        'sub': user.id, 'pid': user.project_id, 'uid': user.uid, 'app_id': app_id,
+        'gen': user.session_generation or 0, 'iat': now
+    }
+    access_ttl = app.config['PROJECT_USER_TOKEN_TTL']
+    secret = get_session_token_secret(app_id)
+    return {
+        'access_token': sign_token(secret, dict(claims, typ='access', exp=now + access_ttl, jti=uuid.uuid4().hex)),
+        'refresh_token': sign_token(secret, dict(
+            claims, typ='refresh', exp=now + app.config['PROJECT_USER_REFRESH_TOKEN_TTL'], jti=uuid.uuid4().hex
+        )),
+        'token_type': 'Bearer',
+        'expires_in': access_ttl
+    }
+
+def verify_session_token(app_id, token, typ='access'):
+    """
+    无状态校验项目用户会话令牌（签名、有效期、类型和内存吊销名单），
+    返回令牌载荷，校验失败时抛出ValueError
+    """
+    if not token_signing_enabled():
+        raise ValueError('服务端未设置SECRET_KEY，会话令牌不可用')
+    claims = decode_token(get_session_token_secret(app_id), token)
+    if claims.get('typ') != typ or claims.get('app_id') != app_id or not isinstance(claims.get('sub'), int):
+        raise ValueError('令牌无效')
+    if session_token_denylist.is_revoked(claims):
+        raise ValueError('令牌已被吊销')
+    return claims
+
+def revoke_session_token(claims):
+    """
+    吊销单个会话令牌并提交。jti有唯一约束，令牌已被吊销（包括其他进程刚刚使用过的刷新令牌）时
+    写入冲突并返回False，各进程据此判断，不依赖内存吊销名单的刷新间隔
+    """
+    session_token_denylist.add_token(claims['jti'])
+    try:
+        db.session.add(ProjectUserTokenRevocation(
+            jti=claims['jti'],
+            user_id=claims['sub'],
+            expires_at=datetime.fromtimestamp(claims['exp'], pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+        ))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+def revoke_project_user_sessions(user_id):
+    """
+    吊销项目用户此前签发的全部会话令牌，用于封禁、删除和修改密码（由调用方提交）。
+    用户的会话代数加一，此前签发的令牌携带的代数都更小
+    """
+    now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+    ProjectUser.query.filter_by(id=user_id).update({
+        ProjectUser.session_generation: db.func.coalesce(ProjectUser.session_generation, 0) + 1
+    }, synchronize_session='fetch')
+    generation = db.session.query(ProjectUser.session_generation).filter_by(id=user_id).scalar() or 0
+    db.session.add(ProjectUserTokenRevocation(
+        user_id=user_id,
+        generation=generation,
+        revoked_at=now,
+        expires_at=now + timedelta(seconds=app.config['PROJECT_USER_REFRESH_TOKEN_TTL'])
+    ))
+    # 调用方提交成功后才加入本进程的内存吊销名单，回滚的封禁或改密不会留下吊销
+    db.session.info.setdefault('revoked_user_generations', []).append((user_id, generation))
+
+@event.listens_for(db.session, 'after_commit')
+def apply_session_revocations(session):
+    for user_id, generation in session.info.pop('revoked_user_generations', []):
+        session_token_denylist.add_user(user_id, generation)
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_session_revocations(session):
+    session.info.pop('revoked_user_generations', None)
+
+def purge_token_revocations():
+    """清理已过期令牌对应的吊销记录"""
+    with app.app_context():
+        try:
+            now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+            deleted = ProjectUserTokenRevocation.query.filter(
+                ProjectUserTokenRevocation.expires_at <= now
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            if deleted:
+                app.logger.info(f'已清理 {deleted} 条过期的令牌吊销记录')
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f'清理令牌吊销记录失败: {str(e)}')
+
+def create_default_admin():
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        if not admin:
+            admin = User(
+                username='admin',
+                email='admin@example.com',
+                password_hash=generate_password_hash('admin123'),
+                is_admin=True,
+                email_verified=True
+            )
+            db.session.add(admin)
+            db.session.commit()
+
+def update_existing_users_uid():
+    with app.app_context():
+        users = User.query.filter_by(uid=None).all()
+        for user in users:
+            user.uid = user.generate_uid()
+        db.session.commit()
+
+class ReusableSMTPConnection:
+    """
+    复用的SMTP连接：首次发送时建立，之后的邮件沿用同一连接，
+    空闲超过idle_timeout秒或发送出错后断开，下次发送时重新连接
+    """
+
+    def __init__(self, idle_timeout=30):
+        self.idle_timeout = idle_timeout
+        self.opened = 0
+        self._connection = None
+        self._last_used = 0
+
+    def send(self, msg):
+        if self._connection is None:
+            connection = mail.connect()
+            connection.__enter__()
+            self._connection = connection
+            self.opened += 1
+        try:
+            self._connection.send(msg)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+            # 服务器拒收单封邮件，连接仍可继续使用
+            self._last_used = time.monotonic()
+            raise
+        except Exception:
+            # 连接状态未知，丢弃后由下一封邮件重新建立
+            self.close()
+            raise
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self._connection is not None and time.monotonic() - self._last_used >= self.idle_timeout:
+            self.close()
+
+    def close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+
+class EmailQueue:
+    """
+    邮件发送队列：请求线程只把邮件写入OutboundEmail后返回，后台线程领取到期的邮件，
+    通过复用的SMTP连接逐封发送；失败后按指数退避重试，超过max_attempts次标记为失败。
+    领取时用条件UPDATE抢占，多个工作进程同时运行时同一封邮件只会被一个进程发送
+    """
+
+    def __init__(self, poll_interval=5, batch_size=50, idle_timeout=30, max_attempts=5,
+                 retry_backoff=30, max_backoff=3600, sending_timeout=600):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.sending_timeout = sending_timeout
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.smtp = ReusableSMTPConnection(idle_timeout=idle_timeout)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enqueue(self, category, recipient, subject, html):
+        """写入待发送邮件并提交，唤醒后台线程"""
+        db.session.add(OutboundEmail(category=category, recipient=recipient, subject=subject, html=html))
+        db.session.commit()
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        # 首次入队时才启动线程，避免在导入模块或预加载的父进程中创建线程
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name='email-queue', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                with app.app_context():
+                    while not self._stop.is_set() and self.process_batch():
+                        pass
+            except Exception as e:
+                app.logger.error(f'处理邮件队列失败: {str(e)}')
+            self.smtp.close_if_idle()
+            self._wakeup.wait(self.poll_interval)
+        self.smtp.close()
+
+    def _claim(self):
+        """领取到期的邮件，发送中超时的邮件也重新领取"""
+        now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+        ids = [row.id for row in db.session.query(OutboundEmail.id).filter(
+            OutboundEmail.status.in_(('pending', 'sending')),
+            OutboundEmail.next_attempt_at <= now
+        ).order_by(OutboundEmail.next_attempt_at).limit(self.batch_size)]
+        claimed = []
+        for email_id in ids:
+            result = db.session.execute(
+                db.update(OutboundEmail)
+                .where(
+                    OutboundEmail.id == email_id,
+                    OutboundEmail.status.in_(('pending', 'sending')),
+                    OutboundEmail.next_attempt_at <= now
+                )
+                .values(status='sending', next_attempt_at=now + timedelta(seconds=self.sending_timeout))
+            )
+            if result.rowcount == 1:
+                claimed.append(email_id)
+        db.session.commit()
+        return claimed
+
+    def process_batch(self):
+        """发送一批到期的邮件，返回处理的数量"""
+        claimed = self._claim()
+        for email_id in claimed:
+            email = db.session.get(OutboundEmail, email_id)
+            now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+            try:
+                self.smtp.send(Message(subject=email.subject, recipients=[email.recipient], html=email.html))
+            except Exception as e:
+                email.attempts += 1
+                email.last_error = str(e)[:255]
+                if email.attempts >= self.max_attempts:
+                    email.status = 'failed'
+                    self.failed += 1
+                    app.logger.error(f'邮件发送失败（{email.category}，{email.recipient}）: {e}')
+                else:
+                    email.status = 'pending'
+                    email.next_attempt_at = now + timedelta(seconds=min(
+                        self.max_backoff, self.retry_backoff * 2 ** (email.attempts - 1)
+                    ))
+                    self.retried += 1
+            else:
+                email.attempts += 1
+                email.status = 'sent'
+                email.sent_at = now
+                email.last_error = None
+                self.sent += 1
+            db.session.commit()
+        return len(claimed)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval)
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+            'connections_opened': self.smtp.opened,
+            'running': self._thread is not None and self._thread.is_alive()
+        }
+
+email_queue = EmailQueue(
+    poll_interval=app.config['MAIL_QUEUE_POLL_INTERVAL'],
+    batch_size=app.config['MAIL_QUEUE_BATCH_SIZE'],
+    idle_timeout=app.config['MAIL_CONNECTION_IDLE_TIMEOUT'],
+    max_attempts=app.config['MAIL_MAX_ATTEMPTS'],
+    retry_backoff=app.config['MAIL_RETRY_BACKOFF'],
+    max_backoff=app.config['MAIL_RETRY_MAX_BACKOFF'],
+    sending_timeout=app.config['MAIL_SENDING_TIMEOUT']
+)
+atexit.register(email_queue.stop)
+
+def purge_outbound_emails():
+    """删除超过保留期的已发送和发送失败的邮件记录"""
+    with app.app_context():
+        try:
+            cutoff = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None) - timedelta(days=app.config['MAIL_RETENTION_DAYS'])
+            deleted = OutboundEmail.query.filter(
+                OutboundEmail.status.in_(('sent', 'failed')),
+                OutboundEmail.created_at < cutoff
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            if deleted:
+                app.logger.info(f'已清理 {deleted} 条过期的邮件记录')
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f'清理邮件记录失败: {str(e)}')
+
+def send_verification_email(user):
+    token = user.dev_id
+    verify_url = url_for('verify_email', token=token, _external=True)
+    
+    try:
+        email_queue.enqueue(
+            'verification',
+            user.email,
+            '请验证您的邮箱 - SimpleKeytime',
+            render_template('emails/verification.html', 
+                           user=user, 
+                           verify_url=verify_url)
+        )
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"发送验证邮件失败: {e}")
+
+def send_reset_code_email(user):
+    reset_code = user.generate_reset_code()
+    
+    try:
+        email_queue.enqueue(
+            'reset_code',
+            user.email,
+            '密码重置验证码 - SimpleKeytime',
+            render_template('emails/reset_code.html',
+                           user=user,
+                           reset_code=reset_code)
+        )
+        return True
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"发送验证码失败: {e}")
+        return False
+
+def cleanup_expired_reports():
+    with app.app_context():
+        expired = Report.query.filter(Report.expires_at < datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)).all()
+        for report in expired:
+            db.session.delete(report)
+        db.session.commit()
+
+def compact_api_call_logs():
+    """
+    将超过保留期的API调用日志压缩到ApiCallSummary后删除。每批只处理少量行并单独提交，
+    避免长时间持有锁；单次运行最多处理API_LOG_COMPACT_MAX_BATCHES批，剩余的留到下次
+    """
+    retention_days = app.config['API_LOG_RETENTION_DAYS']
+    if retention_days <= 0:
+        return 0
+    
+    batch_size = app.config['API_LOG_COMPACT_BATCH_SIZE']
+    compacted = 0
+    with app.app_context():
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        for _ in range(app.config['API_LOG_COMPACT_MAX_BATCHES']):
+            rows = db.session.query(ApiCallLog.id, ApiCallLog.user_id, ApiCallLog.endpoint, ApiCallLog.called_at)\
+                .filter(ApiCallLog.called_at < cutoff)\
+                .order_by(ApiCallLog.id)\
+                .limit(batch_size)\
+                .all()
+            if not rows:
+                break
+            
+            counts = Counter((row.user_id, row.endpoint, truncate_to_hour(row.called_at)) for row in rows)
+            try:
+                # 先删除再累加：重叠运行的压缩任务（如开发服务器的重载进程各有一个调度器）
+                # 选中同一批日志时只有一个能删除全部行，另一个回滚，避免重复计数
+                deleted = db.session.query(ApiCallLog)\
+                    .filter(ApiCallLog.id.in_([row.id for row in rows]))\
+                    .delete(synchronize_session=False)
+                if deleted != len(rows):
+                    db.session.rollback()
+                    app.logger.info('API调用日志正由其他任务压缩，本次停止')
+                    break
+                upsert_counters(ApiCallSummary, ['user_id', 'endpoint', 'hour'], [
+                    {'user_id': user_id, 'endpoint': endpoint, 'hour': hour, 'count': count}
+                    for (user_id, endpoint, hour), count in counts.items()
+                ], ['count'])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"压缩API调用日志失败: {e}")
+                break
+            compacted += len(rows)
+    
+    if compacted:
+        app.logger.info(f"已压缩 {compacted} 条过期API调用日志")
+    return compacted
+
+license_expiry_stats = {'runs': 0, 'expired': 0, 'last_run_at': None, 'last_expired': 0}
+
+def expire_license_keys():
+    """
+    将所有项目中已过期但仍为激活状态的卡密标记为未激活。按ix_license_key_is_active_expiry_time
+    索引分批取出ID后执行一条批量UPDATE并单独提交；单次运行最多处理LICENSE_EXPIRY_SWEEP_MAX_BATCHES批
+    """
+    batch_size = app.config['LICENSE_EXPIRY_SWEEP_BATCH_SIZE']
+    expired = 0
+    with app.app_context():
+        now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+        for _ in range(app.config['LICENSE_EXPIRY_SWEEP_MAX_BATCHES']):
+            ids = [row.id for row in db.session.query(LicenseKey.id)
+                .filter(LicenseKey.is_active == True, LicenseKey.expiry_time < now)
+                .order_by(LicenseKey.expiry_time)
+                .limit(batch_size)
+                .all()]
+            if not ids:
+                break
+            
+            try:
+                # 重复检查条件，避免覆盖取ID之后被重新激活或延期的卡密
+                updated = db.session.query(LicenseKey)\
+                    .filter(LicenseKey.id.in_(ids), LicenseKey.is_active == True, LicenseKey.expiry_time < now)\
+                    .update({LicenseKey.is_active: False}, synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"清理过期卡密失败: {e}")
+                break
+            expired += updated
+    
+    license_expiry_stats['runs'] += 1
+    license_expiry_stats['expired'] += expired
+    license_expiry_stats['last_run_at'] = now.strftime('%Y-%m-%d %H:%M:%S')
+    license_expiry_stats['last_expired'] = expired
+    app.logger.info(f"过期卡密清理完成，本次标记 {expired} 个卡密为未激活")
+    return expired
+
+LICENSE_IMPORT_KEY_PATTERN = re.compile(r'^[\x21-\x7e]{1,64}$')
+LICENSE_IMPORT_STATUSES = {
+    '可用': 'available', 'available': 'available',
+    '已激活': 'activated', 'activated': 'activated',
+    '已过期': 'expired', 'expired': 'expired',
+    '已禁用': 'disabled', 'disabled': 'disabled',
+    '已封禁': 'banned', 'banned': 'banned'
+}
+
+def parse_import_datetime(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo:
+        moment = moment.astimezone(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+    return moment
+
+def parse_import_row(row, project_id, created_at):
+    """把导入CSV的一行转换为LicenseKey插入数据，列与导出格式一致，数据无效时抛出ValueError"""
+    key = (row.get('key') or '').strip()
+    if not LICENSE_IMPORT_KEY_PATTERN.match(key):
+        raise ValueError('卡密为空、过长或包含空白及非ASCII字符')
+    try:
+        duration_minutes = int((row.get('duration_minutes') or '').strip())
+    except ValueError:
+        raise ValueError('duration_minutes必须是整数')
+    if duration_minutes <= 0:
+        raise ValueError('duration_minutes必须大于0')
+    
+    try:
+        activation_time = parse_import_datetime(row.get('activation_time'))
+        expiry_time = parse_import_datetime(row.get('expiry_time'))
+        row_created_at = parse_import_datetime(row.get('created_at'))
+    except ValueError:
+        raise ValueError('时间格式无效，应为ISO 8601格式')
+    if activation_time and not expiry_time:
+        expiry_time = activation_time + timedelta(minutes=duration_minutes)
+    
+    raw_status = (row.get('status') or '').strip()
+    status = LICENSE_IMPORT_STATUSES.get(raw_status.lower(), LICENSE_IMPORT_STATUSES.get(raw_status))
+    if raw_status and not status:
+        raise ValueError(f'未知的卡密状态: {raw_status}')
+    if status in ('activated', 'expired') and not activation_time:
+        raise ValueError('已激活或已过期的卡密必须提供activation_time')
+    if status == 'available' and activation_time:
+        raise ValueError('可用状态的卡密不能有activation_time')
+    
+    return {
+        'key': key,
+        'project_id': project_id,
+        'duration_minutes': duration_minutes,
+        'is_active': status not in ('disabled', 'banned'),
+        'is_banned': status == 'banned',
+        'activation_time': activation_time,
+        'expiry_time': expiry_time,
+        'created_at': row_created_at or created_at,
+        'notes': (row.get('notes') or '').strip() or None
+    }
+
+def import_license_keys(project, lines, on_progress=None):
+    """
+    从CSV文本行流导入卡密，表头至少包含key和duration_minutes，其余列与导出格式一致。
+    每LICENSE_IMPORT_CHUNK_SIZE行校验并剔除重复卡密后批量INSERT并提交，内存占用只与批大小有关。
+    返回导入结果，errors中记录出错的行号和原因，最多LICENSE_IMPORT_MAX_ERRORS条
+    """
+    chunk_size = app.config['LICENSE_IMPORT_CHUNK_SIZE']
+    lookup_size = app.config['LICENSE_BATCH_CHUNK_SIZE']
+    max_errors = app.config['LICENSE_IMPORT_MAX_ERRORS']
+    created_at = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+    result = {'total': 0, 'imported': 0, 'failed': 0, 'errors': []}
+    
+    def add_error(line, key, message):
+        result['failed'] += 1
+        if len(result['errors']) < max_errors:
+            result['errors'].append({'line': line, 'key': key, 'error': message})
+    
+    def flush(chunk):
+        keys = list(chunk)
+        existing = set()
+        for start in range(0, len(keys), lookup_size):
+            existing.update(row.key for row in db.session.query(LicenseKey.key)
+                .filter(LicenseKey.key.in_(keys[start:start + lookup_size])))
+        rows = []
+        for key, (line, values) in chunk.items():
+            if key in existing:
+                add_error(line, key, '卡密已存在')
+            else:
+                rows.append(values)
+        if not rows:
+            return
+        
+        try:
+            db.session.execute(db.insert(LicenseKey), rows)
+            activations = Counter(
+                (project.user_id, truncate_to_hour(values['activation_time']))
+                for values in rows if values['activation_time']
+            )
+            if activations:
+                increment_hourly_stats('activations', activations)
+            db.session.commit()
+            result['imported'] += len(rows)
+        except IntegrityError:
+            # 与并发写入冲突，整批按失败处理，可修正后重新导入这些行
+            db.session.rollback()
+            for key, (line, values) in chunk.items():
+                if key not in existing:
+                    add_error(line, key, '写入冲突，请重试')
+        if on_progress:
+            on_progress(result)
+    
+    reader = csv.DictReader(lines)
+    missing = {'key', 'duration_minutes'} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f'CSV缺少必需的列: {", ".join(sorted(missing))}')
+    
+    chunk = {}
+    for row in reader:
+        result['total'] += 1
+        line = reader.line_num
+        try:
+            values = parse_import_row(row, project.id, created_at)
+        except ValueError as e:
+            add_error(line, (row.get('key') or '').strip(), str(e))
+            continue
+        if values['key'] in chunk:
+            add_error(line, values['key'], '文件中卡密重复')
+            continue
+        chunk[values['key']] = (line, values)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = {}
+    if chunk:
+        flush(chunk)
+    return result
+
+def run_license_generation_job(job_id):
+    """在后台线程中执行卡密生成任务，失败时记录错误信息，已提交的批次保留"""
+    with app.app_context():
+        job = db.session.get(LicenseGenerationJob, job_id)
+        job.status = 'running'
+        db.session.commit()
+        
+        def update_progress(generated):
+            db.session.query(LicenseGenerationJob)\
+                .filter_by(id=job_id)\
+                .update({LicenseGenerationJob.generated: generated}, synchronize_session=False)
+        
+        try:
+            insert_license_keys(job.project_id, job.quantity, job.duration_minutes, job.notes, update_progress)
+            status, error = 'completed', None
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"卡密生成任务 {job_id} 失败: {e}")
+            status, error = 'failed', str(e)[:255]
+        
+        job = db.session.get(LicenseGenerationJob, job_id)
+        job.status = status
+        job.error = error
+        job.finished_at = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+        db.session.commit()
+        app.logger.info(f"卡密生成任务 {job_id} 结束，状态 {status}，已生成 {job.generated}/{job.quantity} 个卡密")
+
+def fail_interrupted_license_generation_jobs():
+    """服务重启后，上次进程中未完成的生成任务已中断，标记为失败"""
+    db.session.query(LicenseGenerationJob)\
+        .filter(LicenseGenerationJob.status.in_(['pending', 'running']))\
+        .update({
+            LicenseGenerationJob.status: 'failed',
+            LicenseGenerationJob.error: '服务重启，任务已中断',
+            LicenseGenerationJob.finished_at: datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+        }, synchronize_session=False)
+    db.session.commit()
+
+def start_license_generation_job(job):
+    threading.Thread(
+        target=run_license_generation_job,
+        args=(job.id,),
+        name=f'license-generation-{job.id}',
+        daemon=True
+    ).start()
+
+# 邮件模板中的收件人称呼在整批渲染后逐个替换
+CAMPAIGN_RECIPIENT_PLACEHOLDER = '__SKT_RECIPIENT_NAME__'
+
+def filter_project_user_query(query, args):
+    """按用户列表的搜索词q（用户名、邮箱或UID前缀）和状态status筛选项目用户"""
+    search = (args.get('q') or '').strip()
+    if search:
+        query = query.filter(db.or_(
+            ProjectUser.username.startswith(search, autoescape=True),
+            ProjectUser.email.startswith(search, autoescape=True),
+            ProjectUser.uid.startswith(search, autoescape=True)
+        ))
+    
+    status = (args.get('status') or '').strip()
+    not_banned = db.or_(ProjectUser.is_banned == False, ProjectUser.is_banned.is_(None))
+    if status == 'banned':
+        query = query.filter(ProjectUser.is_banned == True)
+    elif status == 'active':
+        query = query.filter(not_banned, ProjectUser.is_active == True)
+    elif status == 'inactive':
+        query = query.filter(not_banned, db.or_(ProjectUser.is_active == False, ProjectUser.is_active.is_(None)))
+    return query
+
+class CampaignClaimLost(Exception):
+    pass
+
+def email_campaign_stale_before(now):
+    return now - timedelta(seconds=app.config['MAIL_CAMPAIGN_STALE_TIMEOUT'])
+
+def claim_email_campaign(campaign_id, owner):
+    """
+    用条件UPDATE领取未结束的群发任务：只有无人领取或原发送线程心跳超时的任务才能领取，
+    多个进程（如开发服务器的重载进程）同时恢复任务时只有一个能成功
+    """
+    now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+    result = db.session.execute(
+        db.update(EmailCampaign)
+        .where(
+            EmailCampaign.id == campaign_id,
+            EmailCampaign.status.in_(('pending', 'running')),
+            db.or_(
+                EmailCampaign.claimed_by.is_(None),
+                EmailCampaign.heartbeat_at.is_(None),
+                EmailCampaign.heartbeat_at < email_campaign_stale_before(now)
+            )
+        )
+        .values(claimed_by=owner, heartbeat_at=now)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+def heartbeat_email_campaign(campaign_id, owner):
+    """更新心跳，任务已被其他线程接手时返回False"""
+    result = db.session.execute(
+        db.update(EmailCampaign)
+        .where(EmailCampaign.id == campaign_id, EmailCampaign.claimed_by == owner)
+        .values(heartbeat_at=datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None))
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+def run_email_campaign(campaign_id):
+    """
+    在后台线程中群发公告：按用户ID分批读取收件人，邮件模板每批只渲染一次，
+    通过复用的SMTP连接按MAIL_CAMPAIGN_RATE限速逐个发送，每批结束后提交进度并检查是否已取消
+    """
+    with app.app_context():
+        owner = uuid.uuid4().hex
+        if not claim_email_campaign(campaign_id, owner):
+            return
+        # 只有仍为pending的任务才改为running，不覆盖开始前的取消
+        db.session.execute(
+            db.update(EmailCampaign)
+            .where(EmailCampaign.id == campaign_id, EmailCampaign.status == 'pending')
+            .values(status='running')
+        )
+        db.session.commit()
+        
+        campaign = db.session.get(EmailCampaign, campaign_id)
+        if campaign.status != 'running':
+            return
+        filters = {'q': campaign.search, 'status': campaign.user_status}
+        recipients = filter_project_user_query(
+            db.session.query(ProjectUser.id, ProjectUser.email, ProjectUser.username, ProjectUser.nickname)
+            .filter(ProjectUser.project_id == campaign.project_id),
+            filters
+        )
+        campaign.total = recipients.with_entities(db.func.count(ProjectUser.id)).scalar()
+        db.session.commit()
+        
+        chunk_size = app.config['MAIL_CAMPAIGN_CHUNK_SIZE']
+        rate = app.config['MAIL_CAMPAIGN_RATE']
+        interval = 1 / rate if rate > 0 else 0
+        heartbeat_interval = app.config['MAIL_CAMPAIGN_STALE_TIMEOUT'] / 3
+        smtp = ReusableSMTPConnection(idle_timeout=app.config['MAIL_CONNECTION_IDLE_TIMEOUT'])
+        next_send = time.monotonic()
+        last_heartbeat = time.monotonic()
+        status, error = 'completed', None
+        
+        try:
+            while True:
+                rows = recipients.filter(ProjectUser.id > campaign.last_user_id)\
+                    .order_by(ProjectUser.id)\
+                    .limit(chunk_size)\
+                    .all()
+                if not rows:
+                    break
+                
+                html = render_template('emails/announcement.html',
+                                       project=campaign.project,
+                                       subject=campaign.subject,
+                                       content=campaign.content,
+                                       recipient_name=CAMPAIGN_RECIPIENT_PLACEHOLDER,
+                                       current_year=datetime.now().year)
+                sent = failed = 0
+                for row in rows:
+                    # 限速较低时一批可能发送很久，批内也要更新心跳
+                    if time.monotonic() - last_heartbeat >= heartbeat_interval:
+                        if not heartbeat_email_campaign(campaign_id, owner):
+                            raise CampaignClaimLost()
+                        last_heartbeat = time.monotonic()
+                    if interval:
+                        delay = next_send - time.monotonic()
+                        if delay > 0:
+                            time.sleep(delay)
+                        next_send = max(next_send, time.monotonic() - interval) + interval
+                    try:
+                        smtp.send(Message(
+                            subject=campaign.subject,
+                            recipients=[row.email],
+                            html=html.replace(CAMPAIGN_RECIPIENT_PLACEHOLDER, str(escape(row.nickname or row.username)))
+                        ))
+                        sent += 1
+                    except Exception as e:
+                        failed += 1
+                        campaign.error = f'{row.email}: {e}'[:255]
+                
+                campaign.sent += sent
+                campaign.failed += failed
+                campaign.last_user_id = rows[-1].id
+                campaign.heartbeat_at = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+                db.session.commit()
+                last_heartbeat = time.monotonic()
+                
+                db.session.refresh(campaign, ['status', 'claimed_by'])
+                if campaign.claimed_by != owner:
+                    raise CampaignClaimLost()
+                if campaign.status == 'cancelled':
+                    status = 'cancelled'
+                    break
+        except CampaignClaimLost:
+            # 心跳超时后已由其他线程接手，由接手的线程负责结束任务
+            db.session.rollback()
+            app.logger.warning(f"公告群发任务 {campaign_id} 已被其他线程接手，停止发送")
+            return
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"公告群发任务 {campaign_id} 失败: {e}")
+            status, error = 'failed', str(e)[:255]
+        finally:
+            smtp.close()
+        
+        # 发送期间被取消的任务保持cancelled
+        db.session.execute(
+            db.update(EmailCampaign)
+            .where(EmailCampaign.id == campaign_id, EmailCampaign.status == 'running')
+            .values(status=status)
+        )
+        campaign = db.session.get(EmailCampaign, campaign_id)
+        if error:
+            campaign.error = error
+        campaign.finished_at = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+        db.session.commit()
+        app.logger.info(f"公告群发任务 {campaign_id} 结束，状态 {campaign.status}，成功 {campaign.sent} 封，失败 {campaign.failed} 封")
+
+def start_email_campaign(campaign):
+    threading.Thread(
+        target=run_email_campaign,
+        args=(campaign.id,),
+        name=f'email-campaign-{campaign.id}',
+        daemon=True
+    ).start()
+
+def resume_interrupted_email_campaigns():
+    """
+    从last_user_id继续发送无人领取或心跳超时的群发任务，中断时正在发送的一批可能重复发送。
+    服务启动时和定时任务中执行，是否接手由发送线程中的claim_email_campaign决定
+    """
+    with app.app_context():
+        now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+        for campaign in EmailCampaign.query.filter(
+            EmailCampaign.status.in_(['pending', 'running']),
+            db.or_(
+                EmailCampaign.claimed_by.is_(None),
+                EmailCampaign.heartbeat_at.is_(None),
+                EmailCampaign.heartbeat_at < email_campaign_stale_before(now)
+            )
+        ).all():
+            start_email_campaign(campaign)
+
+def get_password_hash_method(project):
+    return (project.password_hash_method if project else None) or app.config['PROJECT_USER_HASH_METHOD']
+
+class PasswordHasherBusy(Exception):
+    pass
+
+class PasswordHasher:
+    """
+    在独立进程中计算和校验密码哈希，避免CPU密集的哈希计算占用请求线程的GIL。
+    子进程以spawn方式启动，只导入werkzeug和password_hashing模块；
+    同时提交的任务数受max_pending限制，已满时最多等待queue_timeout秒，仍无空位则抛出PasswordHasherBusy；
+    workers为0时直接在当前线程计算
+    """
+
+    def __init__(self, workers=1, max_pending=64, queue_timeout=2, timeout=10):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.completed = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._max_pending = max(1, max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn启动的子进程不继承请求线程、调度器等线程持有的锁
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _run(self, func, *args):
+        if self.workers <= 0:
+            return func(*args)
+        
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusy()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except concurrent.futures.process.BrokenProcessPool:
+            self._slots.release()
+            # 有子进程异常退出时重建进程池
+            with self._lock:
+                self._executor = None
+            raise
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        
+        result = future.result(timeout=self.timeout)
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def hash(self, password, method):
+        return self._run(generate_password_hash, password, method)
+
+    def verify(self, password_hash, password, method):
+        return self._run(verify_and_rehash_password, password_hash, password, method)
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'max_pending': self._max_pending,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'started': self._executor is not None
+        }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+password_hasher = PasswordHasher(
+    workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+    queue_timeout=app.config['PASSWORD_HASH_QUEUE_TIMEOUT'],
+    timeout=app.config['PASSWORD_HASH_TIMEOUT']
+)
+atexit.register(password_hasher.shutdown)
+
+class ApiCallLogWriter:
+    """
+    API调用日志的后台批量写入器：请求线程只负责入队，后台线程每隔flush_interval秒
+    或攒够batch_size条后批量插入；队列满时丢弃新日志并计数，进程退出时写完剩余日志
+    """
+
+    def __init__(self, maxsize=10000, batch_size=500, flush_interval=0.5):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, row):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _ensure_started(self):
+        # 首次写日志时才启动线程，避免在导入模块或预加载的父进程中创建线程
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name='api-call-log-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+
+    def _collect(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with self._write_lock:
+            try:
+                with app.app_context():
+                    db.session.execute(db.insert(ApiCallLog), batch)
+                    increment_hourly_stats('api_calls', Counter(
+                        (row['user_id'], truncate_to_hour(utc_to_beijing(row['called_at'])))
+                        for row in batch
+                    ))
+                    db.session.commit()
+                with self._lock:
+                    self.written += len(batch)
+                    self.flushes += 1
+            except Exception as e:
+                with self._lock:
+                    self.failed += len(batch)
+                app.logger.error(f"Failed to write API call logs: {e}")
+
+    def flush(self):
+        """同步写入队列中剩余的全部日志"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval * 4)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'queue_size': self.queue.maxsize,
+                'written': self.written,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'flushes': self.flushes
+            }
+
+api_log_writer = ApiCallLogWriter(
+    maxsize=app.config['API_LOG_QUEUE_SIZE'],
+    batch_size=app.config['API_LOG_BATCH_SIZE'],
+    flush_interval=app.config['API_LOG_FLUSH_INTERVAL']
+)
+atexit.register(api_log_writer.stop)
+
+def get_api_call_user_id():
+    """确定API调用所属的开发者：已登录用户，或请求路径中app_id对应项目的所有者"""
+    if current_user.is_authenticated:
+        return current_user.id
+    if g.get('api_user_id'):
+        return g.api_user_id
+    app_id = (request.view_args or {}).get('app_id')
+    if app_id:
+        project = get_cached_project(app_id)
+        if project:
+            return project['user_id']
+    return None
+
+class TokenBucketLimiter:
+    """
+    令牌桶限流器：每个键一个容量为capacity的桶，每period秒匀速补满，每次请求消耗一个令牌。
+    hit接收[(键, capacity, period)]，先检查全部桶，都有令牌时才各消耗一个；
+    返回0表示放行，否则返回需要等待的秒数，被拒绝的请求不消耗任何桶的令牌
+    """
+
+    def __init__(self):
+        self.allowed = 0
+        self.rejected = 0
+
+    @staticmethod
+    def take(tokens, updated, now, capacity, period):
+        """返回(剩余令牌数, 需要等待的秒数)"""
+        rate = capacity / period
+        if tokens is None:
+            tokens = capacity
+        else:
+            tokens = min(capacity, tokens + max(0, now - updated) * rate)
+        if tokens >= 1:
+            return tokens - 1, 0
+        return tokens, (1 - tokens) / rate
+
+    def count(self, retry_after):
+        if retry_after:
+            self.rejected += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+    def stats(self):
+        return {
+            'backend': self.backend,
+            'allowed': self.allowed,
+            'rejected': self.rejected
+        }
+
+class MemoryRateLimiter(TokenBucketLimiter):
+    """进程内的令牌桶，多个工作进程各自计数"""
+    backend = 'memory'
+
+    def __init__(self, max_keys=100000):
+        super().__init__()
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, limits):
+        now = time.monotonic()
+        with self._lock:
+            taken = {}
+            retry_after = 0
+            for key, capacity, period in limits:
+                tokens, updated = self._buckets.get(key, (None, now))
+                taken[key], wait = self.take(tokens, updated, now, capacity, period)
+                retry_after = max(retry_after, wait)
+            if not retry_after:
+                for key, tokens in taken.items():
+                    self._buckets[key] = (tokens, now)
+                    self._buckets.move_to_end(key)
+                # 被淘汰的桶视为已补满
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            return self.count(retry_after)
+
+    def stats(self):
+        stats = super().stats()
+        stats['keys'] = len(self._buckets)
+        return stats
+
+class SQLiteRateLimiter(TokenBucketLimiter):
+    """
+    保存在本地SQLite文件中的令牌桶，同一台机器上的多个工作进程共享计数。
+    每个线程使用独立连接，读写在BEGIN IMMEDIATE事务中完成；SQLite出错时放行请求，不影响接口可用性
+    """
+    backend = 'sqlite'
+
+    def __init__(self, path, idle_seconds=3600, purge_interval=60, lock_timeout=1):
+        super().__init__()
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self.purge_interval = purge_interval
+        self.lock_timeout = lock_timeout
+        self.errors = 0
+        self._purged_at = 0
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.lock_timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_limit_bucket '
+                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def hit(self, limits):
+        # 多个进程之间只能使用墙上时钟
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                taken = []
+                retry_after = 0
+                for key, capacity, period in limits:
+                    row = conn.execute('SELECT tokens, updated FROM rate_limit_bucket WHERE key = ?', (key,)).fetchone()
+                    tokens, wait = self.take(row[0] if row else None, row[1] if row else now, now, capacity, period)
+                    taken.append((key, tokens, now))
+                    retry_after = max(retry_after, wait)
+                if not retry_after:
+                    conn.executemany(
+                        'INSERT INTO rate_limit_bucket (key, tokens, updated) VALUES (?, ?, ?) '
+                        'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                        taken
+                    )
+                # 闲置超过idle_seconds的桶早已补满，删除不影响限流结果
+                if now - self._purged_at >= self.purge_interval:
+                    self._purged_at = now
+                    conn.execute('DELETE FROM rate_limit_bucket WHERE updated < ?', (now - self.idle_seconds,))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            self.errors += 1
+            app.logger.error(f'限流计数失败: {str(e)}')
+            return 0
+        return self.count(retry_after)
+
+    def stats(self):
+        stats = super().stats()
+        stats['errors'] = self.errors
+        return stats
 
-def calculate_duration_minutes(duration_value, duration_unit):
-    """将各种时间单位转换为分钟"""
-    duration_value = max(1, int(duration_value))
-    
-    if duration_unit == 'minutes':
-        return duration_value
-    elif duration_unit == 'hours':
-        return duration_value * 60
-    elif duration_unit == 'days':
-        return duration_value * 60 * 24
-    elif duration_unit == 'months':
-        return duration_value * 60 * 24 * 30  # 按30天算一个月
-    else:
-        return duration_value  # 默认按分钟
+def create_rate_limiter():
+    if app.config['RATE_LIMIT_BACKEND'] == 'sqlite':
+        path = app.config['RATE_LIMIT_SQLITE_PATH']
+        if not os.path.isabs(path):
+            os.makedirs(app.instance_path, exist_ok=True)
+            path = os.path.join(app.instance_path, path)
+        idle_seconds = max(
+            (period for rules in app.config['RATE_LIMITS'].values() for _, period in rules.values()),
+            default=3600
+        )
+        return SQLiteRateLimiter(path, idle_seconds=idle_seconds)
+    return MemoryRateLimiter(max_keys=app.config['RATE_LIMIT_MAX_KEYS'])
 
-def create_default_admin():
-    with app.app_context():
-        admin = User.query.filter_by(username='admin').first()
-        if not admin:
-            admin = User(
-                username='admin',
-                email='admin@example.com',
-                password_hash=generate_password_hash('admin123'),
-                is_admin=True,
-                email_verified=True
-            )
-            db.session.add(admin)
-            db.session.commit()
+rate_limiter = create_rate_limiter()
 
-def update_existing_users_uid():
-    with app.app_context():
-        users = User.query.filter_by(uid=None).all()
-        for user in users:
-            user.uid = user.generate_uid()
-        db.session.commit()
+# 需要计算密码哈希或发送邮件的接口单独使用更严格的限流规则
+RATE_LIMIT_ENDPOINT_GROUPS = {
+    'api_v1.user_login': 'auth',
+    'api_v1.user_register': 'auth',
+    'api_v1.user_refresh_token': 'auth',
+    'api_v1.send_reset_email': 'auth',
+}
 
-def send_verification_email(user):
-    token = user.dev_id
-    verify_url = url_for('verify_email', token=token, _external=True)
-    
-    msg = Message(
-        subject='请验证您的邮箱 - SimpleKeytime',
-        recipients=[user.email],
-        html=render_template('emails/verification.html', 
-                           user=user, 
-                           verify_url=verify_url)
-    )
-    
-    try:
-        mail.send(msg)
-    except Exception as e:
-        app.logger.error(f"发送验证邮件失败: {e}")
+def get_rate_limit_group():
+    """按接口确定限流分组：RATE_LIMIT_ENDPOINT_GROUPS中的接口，其余按/v1/api之后的第一段路径"""
+    group = RATE_LIMIT_ENDPOINT_GROUPS.get(request.endpoint)
+    if group:
+        return group
+    return request.url_rule.rule[len(api_v1.url_prefix):].strip('/').split('/')[0]
 
-def send_reset_code_email(user):
-    reset_code = user.generate_reset_code()
-    
-    msg = Message(
-        subject='密码重置验证码 - SimpleKeytime',
-        recipients=[user.email],
-        html=render_template('emails/reset_code.html',
-                           user=user,
-                           reset_code=reset_code)
-    )
+@api_v1.before_request
+def enforce_rate_limits():
+    """在进入接口、访问数据库之前按IP和app_id限流，超出时返回429"""
+    if not app.config['RATE_LIMIT_ENABLED'] or request.url_rule is None:
+        return None
     
-    try:
-        mail.send(msg)
-        return True
-    except Exception as e:
-        app.logger.error(f"发送验证码失败: {e}")
-        return False
-
-def cleanup_expired_reports():
-    with app.app_context():
-        expired = Report.query.filter(Report.expires_at < datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)).all()
-        for report in expired:
-            db.session.delete(report)
-        db.session.commit()
+    group = get_rate_limit_group()
+    rules = app.config['RATE_LIMITS'].get(group, {})
+    scopes = {'ip': request.remote_addr, 'app_id': (request.view_args or {}).get('app_id')}
+    limits = [
+        (f'{group}:{scope}:{scopes[scope]}', capacity, period)
+        for scope, (capacity, period) in rules.items() if scopes.get(scope)
+    ]
+    if not limits:
+        return None
+    # 所有桶都有令牌时才消耗，被app_id限流的请求不占用IP的额度，反之亦然
+    retry_after = rate_limiter.hit(limits)
+    if retry_after:
+        g.rate_limited = True
+        response = jsonify({
+            'status': 'error',
+            'message': '请求过于频繁，请稍后再试'
+        })
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+        return response, 429
+    return None
 
 @app.after_request
 def log_api_call(response):
-    if request.path.startswith('/v1/api/'):
+    # 被限流的请求（避免为其查询项目所有者）和stress-activate的压测请求不记录
+    if request.path.startswith('/v1/api/') and not g.get('rate_limited') and not request.environ.get('skt.synthetic'):
         try:
-            api_call = ApiCallLog(
-                user_id=current_user.id if current_user.is_authenticated else None,
-                endpoint=request.path,
-                ip_address=request.remote_addr
-            )
-            db.session.add(api_call)
-            db.session.commit()
+            user_id = get_api_call_user_id()
+            # 无法归属到开发者的调用（如不存在的app_id）不记录
+            if user_id:
+                api_log_writer.submit({
+                    'user_id': user_id,
+                    'endpoint': request.path[:100],
+                    'called_at': datetime.utcnow(),
+                    'ip_address': request.remote_addr
+                })
         except Exception as e:
             app.logger.error(f"Failed to log API call: {e}")
     return response
@@ -544,7 +2472,9 @@ def dashboard_home():
         ).count()
     
     # 获取API调用总数
-    api_calls_count = ApiCallLog.query.filter_by(user_id=current_user.id).count()
+    api_calls_count = db.session.query(db.func.coalesce(db.func.sum(HourlyStat.api_calls), 0))\
+        .filter(HourlyStat.user_id == current_user.id)\
+        .scalar()
     
     return render_template('dashboard/home.html',
                          announcements=announcements,
@@ -588,8 +2518,10 @@ def dashboard_projects():
                 project = Project.query.filter_by(id=project_id, user_id=current_user.id).first()
                 
                 if project:
+                    app_id = project.app_id
                     db.session.delete(project)
                     db.session.commit()
+                    invalidate_project_caches(app_id)
                     flash('项目已删除', 'success')
                 else:
                     flash('项目不存在或无权操作', 'error')
@@ -610,9 +2542,18 @@ def dashboard_projects():
                     project.download_url = request.form.get('download_url', '').strip() or None
                     project.announcement = request.form.get('announcement', '').strip() or None
                     project.force_update = request.form.get('force_update') == 'on'
+                    password_hash_method = request.form.get('password_hash_method', '').strip()
+                    if password_hash_method:
+                        try:
+                            password_hash_method = normalize_password_hash_method(password_hash_method)
+                        except ValueError:
+                            flash('密码哈希参数无效', 'error')
+                            return redirect(url_for('dashboard_projects'))
+                    project.password_hash_method = password_hash_method or None
                     project.updated_at = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
                     
                     db.session.commit()
+                    invalidate_project_caches(project.app_id)
                     flash('项目更新成功', 'success')
                 else:
                     flash('项目不存在或无权操作', 'error')
@@ -661,10 +2602,12 @@ def dashboard_my():
 def reset_dev_id():
     try:
         # 生成新的DevID
+        old_dev_id = current_user.dev_id
         new_dev_id = str(uuid.uuid4())
         current_user.dev_id = new_dev_id
         current_user.last_login = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
         db.session.commit()
+        project_auth_cache.invalidate_matching(lambda key: key[1] == old_dev_id)
         
         # 返回包含新DevID的JSON响应
         return jsonify({
@@ -692,7 +2635,32 @@ def get_project_data(project_id):
         'latest_version': project.latest_version,
         'download_url': project.download_url,
         'announcement': project.announcement,
-        'force_update': project.force_update
+        'force_update': project.force_update,
+        'password_hash_method': project.password_hash_method
+    })
+
+# 系统运行统计API
+@app.route('/api/system/stats')
+@login_required
+def get_system_stats():
+    if not current_user.is_admin:
+        return jsonify({'status': 'error', 'message': '无权限访问'}), 403
+    
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'project_cache': project_cache.stats(),
+            'project_auth_cache': project_auth_cache.stats(),
+            'api_log_writer': api_log_writer.stats(),
+            'license_expiry': license_expiry_stats,
+            'password_hasher': password_hasher.stats(),
+            'session_token_denylist': session_token_denylist.stats(),
+            'rate_limiter': rate_limiter.stats(),
+            'email_queue': dict(email_queue.stats(), outbox=dict(
+                db.session.query(OutboundEmail.status, db.func.count(OutboundEmail.id))
+                .group_by(OutboundEmail.status).all()
+            ))
+        }
     })
 
 # 卡密管理路由
@@ -712,42 +2680,52 @@ def dashboard_licenses():
         # 批量操作处理
         if action == 'batch_action':
             try:
-                selected_ids = request.form.get('selected_licenses', '').split(',')
-                selected_ids = [int(id) for id in selected_ids if id]
-                
-                if not selected_ids:
-                    flash('请至少选择一个卡密', 'error')
-                    return redirect(request.referrer or url_for('dashboard_licenses'))
-                
                 batch_action = request.form.get('batch_action_type')
+                if batch_action not in LICENSE_BATCH_UPDATES and batch_action not in ('delete', 'extend'):
+                    flash('无效的批量操作', 'error')
+                    return redirect(request.referrer or url_for('dashboard_licenses'))
                 
-                if not selected_ids:
-                    flash('请至少选择一个卡密', 'error')
-                    return redirect(url_for('dashboard_licenses'))
-                
-                licenses = LicenseKey.query.join(Project)\
-                    .filter(
-                        LicenseKey.id.in_(selected_ids),
-                        Project.user_id == current_user.id
-                    ).all()
+                # 只作用于当前用户项目下的卡密，不加载卡密对象，直接执行一条UPDATE/DELETE
+                query = LicenseKey.query.filter(LicenseKey.project_id.in_(
+                    db.select(Project.id).where(Project.user_id == current_user.id)
+                ))
+                if request.form.get('apply_to') == 'filter':
+                    if request.form.get('project_id'):
+                        query = query.filter(LicenseKey.project_id == request.form.get('project_id', type=int))
+                    try:
+                        query = filter_license_query(query, request.form)
+                    except ValueError as e:
+                        flash(str(e), 'error')
+                        return redirect(request.referrer or url_for('dashboard_licenses'))
+                else:
+                    selected_ids = request.form.get('selected_licenses', '').split(',')
+                    selected_ids = [int(id) for id in selected_ids if id]
+                    if not selected_ids:
+                        flash('请至少选择一个卡密', 'error')
+                        return redirect(request.referrer or url_for('dashboard_licenses'))
+                    query = query.filter(LicenseKey.id.in_(selected_ids))
                 
-                for license in licenses:
-                    if batch_action == 'activate':
-                        license.is_active = True
-                        license.is_banned = False
-                    elif batch_action == 'deactivate':
-                        license.is_active = False
-                    elif batch_action == 'ban':
-                        license.is_banned = True
-                        license.is_active = False
-                    elif batch_action == 'unban':
-                        license.is_banned = False
-                    elif batch_action == 'delete':
-                        db.session.delete(license)
+                if batch_action == 'delete':
+                    affected = query.delete(synchronize_session=False)
+                elif batch_action == 'extend':
+                    extend_value = request.form.get('extend_value', type=int)
+                    if not extend_value or extend_value < 1:
+                        flash('延长时长必须是正整数', 'error')
+                        return redirect(request.referrer or url_for('dashboard_licenses'))
+                    minutes = calculate_duration_minutes(extend_value, request.form.get('extend_unit', 'days'))
+                    affected = query.update({
+                        LicenseKey.duration_minutes: LicenseKey.duration_minutes + minutes,
+                        LicenseKey.expiry_time: db.case(
+                            (LicenseKey.expiry_time.isnot(None), sql_add_minutes(LicenseKey.expiry_time, minutes)),
+                            else_=None
+                        )
+                    }, synchronize_session=False)
+                else:
+                    affected = query.update(LICENSE_BATCH_UPDATES[batch_action], synchronize_session=False)
                 
                 db.session.commit()
-                flash(f'成功{get_action_name(batch_action)} {len(licenses)} 个卡密', 'success')
-                return redirect(url_for('dashboard_licenses'))
+                flash(f'成功{get_action_name(batch_action)} {affected} 个卡密', 'success')
+                return redirect(request.referrer or url_for('dashboard_licenses'))
             
             except Exception as e:
                 db.session.rollback()
@@ -803,22 +2781,33 @@ def dashboard_licenses():
                     flash('项目不存在或无权操作', 'error')
                     return redirect(url_for('dashboard_licenses'))
                 
+                max_keys = app.config['LICENSE_GENERATION_MAX_KEYS']
+                if quantity < 1 or quantity > max_keys:
+                    flash(f'生成数量必须在1到{max_keys}之间', 'error')
+                    return redirect(url_for('dashboard_licenses'))
+                
                 duration_minutes = calculate_duration_minutes(duration_value, duration_unit)
                 
-                new_keys = []
-                for _ in range(quantity):
-                    key = LicenseKey(
-                        key=generate_license_key(),
+                if quantity <= app.config['LICENSE_GENERATION_SYNC_LIMIT']:
+                    insert_license_keys(project.id, quantity, duration_minutes, notes or None)
+                    flash(f'成功生成 {quantity} 个卡密', 'success')
+                elif LicenseGenerationJob.query.filter(
+                    LicenseGenerationJob.user_id == current_user.id,
+                    LicenseGenerationJob.status.in_(['pending', 'running'])
+                ).first():
+                    flash('已有正在进行的卡密生成任务，请等待完成后再试', 'error')
+                else:
+                    job = LicenseGenerationJob(
+                        user_id=current_user.id,
                         project_id=project.id,
+                        quantity=quantity,
                         duration_minutes=duration_minutes,
-                        notes=notes if notes else None,
-                        created_at=get_beijing_time()
+                        notes=notes or None
                     )
-                    new_keys.append(key)
-                    db.session.add(key)
-                
-                db.session.commit()
-                flash(f'成功生成 {quantity} 个卡密', 'success')
+                    db.session.add(job)
+                    db.session.commit()
+                    start_license_generation_job(job)
+                    flash(f'已开始在后台生成 {quantity} 个卡密，可在本页查看进度', 'success')
                 
             except Exception as e:
                 db.session.rollback()
@@ -850,6 +2839,7 @@ def dashboard_licenses():
                         license_key.activation_time = get_beijing_time()
                         license_key.expiry_time = license_key.calculate_expiry()
                         license_key.is_active = True
+                        record_activations(current_user.id, license_key.activation_time)
                         flash('卡密已手动激活', 'success')
                     elif action == 'deactivate':
                         license_key.activation_time = None
@@ -886,19 +2876,6 @@ def dashboard_licenses():
                 app.logger.error(f'删除卡密失败: {str(e)}')
                 flash('删除卡密失败', 'error')
         
-        # 检查并更新过期状态
-        expired_keys = LicenseKey.query.join(Project)\
-            .filter(
-                LicenseKey.expiry_time < get_beijing_time(),
-                LicenseKey.is_active == True,
-                Project.user_id == current_user.id
-            ).all()
-        
-        for key in expired_keys:
-            key.is_active = False
-        if expired_keys:
-            db.session.commit()
-        
         if project_id:
             return redirect(url_for('dashboard_licenses'))
         return redirect(url_for('dashboard_licenses'))
@@ -919,22 +2896,278 @@ def dashboard_licenses():
         except ValueError:
             pass
     
-    licenses = query.order_by(LicenseKey.created_at.desc()).all()
+    try:
+        query = filter_license_query(query, request.args)
+    except ValueError as e:
+        flash(str(e), 'error')
+    
+    per_page = request.args.get('per_page', type=int)
+    if per_page not in app.config['LICENSE_PAGE_SIZES']:
+        per_page = app.config['LICENSE_PAGE_SIZE']
+    sort = request.args.get('sort')
+    if sort not in LICENSE_SORTS:
+        sort = 'created_desc'
+    sort_column, descending = LICENSE_SORTS[sort]
+    
+    total = query.with_entities(db.func.count(LicenseKey.id)).scalar()
+    query = query.options(db.contains_eager(LicenseKey.project))
+    try:
+        licenses, prev_cursor, next_cursor = keyset_paginate(
+            query, sort_column, LicenseKey.id, descending, per_page,
+            after=request.args.get('after'), before=request.args.get('before')
+        )
+    except ValueError as e:
+        # 游标无效时回到第一页
+        flash(str(e), 'error')
+        licenses, prev_cursor, next_cursor = keyset_paginate(query, sort_column, LicenseKey.id, descending, per_page)
+    
+    generation_jobs = LicenseGenerationJob.query\
+        .filter_by(user_id=current_user.id)\
+        .order_by(LicenseGenerationJob.id.desc())\
+        .limit(3)\
+        .all()
     
-    # 转换时间为北京时间
-    for license in licenses:
-        if license.created_at:
-            license.created_at = license.created_at.astimezone(pytz.timezone('Asia/Shanghai'))
-        if license.activation_time:
-            license.activation_time = license.activation_time.astimezone(pytz.timezone('Asia/Shanghai'))
-        if license.expiry_time:
-            license.expiry_time = license.expiry_time.astimezone(pytz.timezone('Asia/Shanghai'))
+    # 翻页链接保留筛选条件
+    filter_args = {key: value for key, value in request.args.items() if key not in ('after', 'before') and value}
     
     return render_template('dashboard/licenses.html', 
                          projects=projects,
                          licenses=licenses,
+                         total=total,
+                         per_page=per_page,
+                         page_sizes=app.config['LICENSE_PAGE_SIZES'],
+                         sort=sort,
+                         filter_args=filter_args,
+                         prev_cursor=prev_cursor,
+                         next_cursor=next_cursor,
+                         generation_jobs=generation_jobs,
                          selected_project_id=project_id if selected_project else None)
 
+LICENSE_SORTS = {
+    'created_desc': (LicenseKey.created_at, True),
+    'created_asc': (LicenseKey.created_at, False),
+    'key_asc': (LicenseKey.key, False),
+}
+
+LICENSE_STATUS_FILTERS = ['available', 'activated', 'expired', 'disabled', 'banned']
+
+LICENSE_BATCH_UPDATES = {
+    'activate': {LicenseKey.is_active: True, LicenseKey.is_banned: False},
+    'deactivate': {LicenseKey.is_active: False},
+    'ban': {LicenseKey.is_banned: True, LicenseKey.is_active: False},
+    'unban': {LicenseKey.is_banned: False},
+}
+
+def license_status_condition(status, now):
+    """生成与LicenseKey.get_status()一致的状态筛选条件"""
+    not_banned = db.or_(LicenseKey.is_banned == False, LicenseKey.is_banned.is_(None))
+    enabled = db.and_(not_banned, LicenseKey.is_active == True)
+    if status == 'banned':
+        return LicenseKey.is_banned == True
+    if status == 'disabled':
+        return db.and_(not_banned, db.or_(LicenseKey.is_active == False, LicenseKey.is_active.is_(None)))
+    if status == 'available':
+        return db.and_(enabled, LicenseKey.activation_time.is_(None))
+    if status == 'activated':
+        return db.and_(enabled, LicenseKey.activation_time.isnot(None),
+                       db.or_(LicenseKey.expiry_time.is_(None), LicenseKey.expiry_time >= now))
+    if status == 'expired':
+        return db.and_(enabled, LicenseKey.activation_time.isnot(None), LicenseKey.expiry_time < now)
+    raise ValueError('无效的卡密状态')
+
+def parse_filter_datetime(value, end=False):
+    """解析筛选参数中的日期或日期时间，结束日期只有日期部分时包含当天"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'无效的日期: {value}')
+    if end and len(value) == 10:
+        moment += timedelta(days=1)
+    return moment
+
+def filter_license_query(query, args):
+    """按请求参数status、key（前缀）、created_from、created_to、notes筛选卡密，参数无效时抛出ValueError"""
+    status = args.get('status', '').strip()
+    if status:
+        if status not in LICENSE_STATUS_FILTERS:
+            raise ValueError('无效的卡密状态')
+        query = query.filter(license_status_condition(
+            status, datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+        ))
+    
+    key_prefix = args.get('key', '').strip()
+    if key_prefix:
+        query = query.filter(LicenseKey.key.startswith(key_prefix, autoescape=True))
+    
+    created_from = parse_filter_datetime(args.get('created_from'))
+    if created_from:
+        query = query.filter(LicenseKey.created_at >= created_from)
+    created_to = parse_filter_datetime(args.get('created_to'), end=True)
+    if created_to:
+        query = query.filter(LicenseKey.created_at < created_to)
+    
+    notes = args.get('notes', '').strip()
+    if notes:
+        query = query.filter(LicenseKey.notes.contains(notes, autoescape=True))
+    return query
+
+LICENSE_EXPORT_FIELDS = ['key', 'status', 'duration_minutes', 'activation_time', 'expiry_time', 'created_at', 'notes']
+
+@app.route('/dashboard/projects/<int:project_id>/licenses/export')
+@login_required
+def export_licenses(project_id):
+    """
+    按筛选条件导出项目卡密，format为csv（默认）或ndjson。
+    使用yield_per分批读取并逐行输出，内存占用与卡密数量无关
+    """
+    project = Project.query.filter_by(id=project_id, user_id=current_user.id).first_or_404()
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'status': 'error', 'message': '不支持的导出格式'}), 400
+    
+    try:
+        query = filter_license_query(LicenseKey.query.filter(LicenseKey.project_id == project.id), request.args)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    query = query.order_by(LicenseKey.id).yield_per(app.config['LICENSE_EXPORT_YIELD_PER'])
+    
+    def export_row(license_key):
+        return {
+            'key': license_key.key,
+            'status': license_key.get_status(),
+            'duration_minutes': license_key.duration_minutes,
+            'activation_time': license_key.activation_time.isoformat() if license_key.activation_time else None,
+            'expiry_time': license_key.expiry_time.isoformat() if license_key.expiry_time else None,
+            'created_at': license_key.created_at.isoformat() if license_key.created_at else None,
+            'notes': license_key.notes
+        }
+    
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=LICENSE_EXPORT_FIELDS)
+        # 带BOM，Excel打开时能正确识别中文
+        buffer.write('\ufeff')
+        writer.writeheader()
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        for index, license_key in enumerate(query, 1):
+            writer.writerow(export_row(license_key))
+            if index % 1000 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    def generate_ndjson():
+        lines = []
+        for license_key in query:
+            lines.append(json.dumps(export_row(license_key), ensure_ascii=False))
+            if len(lines) == 1000:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+    
+    filename = f'licenses-{project.id}-{datetime.now().strftime("%Y%m%d%H%M%S")}.{export_format}'
+    if export_format == 'csv':
+        response = Response(stream_with_context(generate_csv()), mimetype='text/csv')
+    else:
+        response = Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+@app.route('/dashboard/projects/<int:project_id>/licenses/import', methods=['POST'])
+@login_required
+def import_licenses(project_id):
+    """从上传的CSV文件流式导入卡密，返回导入数量和出错行"""
+    project = Project.query.filter_by(id=project_id, user_id=current_user.id).first()
+    if not project:
+        return jsonify({'status': 'error', 'message': '项目不存在或无权操作'}), 404
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'status': 'error', 'message': '请选择要导入的CSV文件'}), 400
+    
+    try:
+        # 上传文件由Werkzeug缓存在临时文件中，这里按行读取
+        result = import_license_keys(project, io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline=''))
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': f'CSV文件无效: {e}'}), 400
+    
+    app.logger.info(f"项目 {project.id} 导入卡密 {result['imported']}/{result['total']} 个")
+    return jsonify({'status': 'success', 'data': result})
+
+def sql_truncate_datetime(column, unit):
+    """生成按小时或按天截断时间的SQL表达式，按数据库方言选择对应的函数"""
+    dialect = db.engine.dialect.name
+    fmt = '%Y-%m-%d %H:00:00' if unit == 'hour' else '%Y-%m-%d 00:00:00'
+    if dialect == 'sqlite':
+        return db.func.strftime(fmt, column)
+    if dialect in ('mysql', 'mariadb'):
+        return db.func.date_format(column, fmt)
+    return db.func.date_trunc(unit, column)
+
+def beijing_to_utc(moment):
+    return pytz.timezone('Asia/Shanghai').localize(moment).astimezone(pytz.UTC).replace(tzinfo=None)
+
+def load_raw_stats_series(user_id, series, start, end, unit):
+    """
+    直接从原始表按时间区间聚合，一条GROUP BY查询返回{区间起点: 数量}。
+    API调用时间以UTC存储，先换算查询范围，再把各小时区间转换回北京时间
+    """
+    if series == 'api':
+        bucket = sql_truncate_datetime(ApiCallLog.called_at, 'hour')
+        rows = db.session.query(bucket, db.func.count(ApiCallLog.id))\
+            .filter(
+                ApiCallLog.user_id == user_id,
+                ApiCallLog.called_at >= beijing_to_utc(start),
+                ApiCallLog.called_at < beijing_to_utc(end)
+            )\
+            .group_by(bucket)\
+            .all()
+        convert = utc_to_beijing
+    else:
+        bucket = sql_truncate_datetime(LicenseKey.activation_time, unit)
+        rows = db.session.query(bucket, db.func.count(LicenseKey.id))\
+            .join(Project, LicenseKey.project_id == Project.id)\
+            .filter(
+                Project.user_id == user_id,
+                LicenseKey.is_active == True,
+                LicenseKey.activation_time >= start,
+                LicenseKey.activation_time < end
+            )\
+            .group_by(bucket)\
+            .all()
+        convert = lambda moment: moment
+    
+    result = Counter()
+    for moment, count in rows:
+        if isinstance(moment, str):
+            moment = datetime.fromisoformat(moment)
+        result[convert(moment)] += count
+    return result
+
+def load_rollup_stats_series(user_id, series_list, start, end):
+    """从小时统计表一次查询整个时间范围，返回{序列: {小时: 数量}}"""
+    columns = {'api': HourlyStat.api_calls, 'license': HourlyStat.activations}
+    rows = db.session.query(HourlyStat.hour, *[columns[series] for series in series_list])\
+        .filter(
+            HourlyStat.user_id == user_id,
+            HourlyStat.hour >= start,
+            HourlyStat.hour < end
+        )\
+        .all()
+    result = {series: Counter() for series in series_list}
+    for row in rows:
+        for i, series in enumerate(series_list):
+            result[series][row[0]] += row[i + 1] or 0
+    return result
+
 @app.route('/dashboard/api-stats')
 @login_required
 def get_api_stats():
@@ -942,80 +3175,55 @@ def get_api_stats():
     stat_type = request.args.get('type', 'api')
     
     now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
-    labels = []
-    data = []
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
     
     if range_type == '24h':
         # 24小时数据，按小时分组
-        for i in range(24):
-            hour_start = now.replace(hour=i, minute=0, second=0, microsecond=0)
-            hour_end = hour_start + timedelta(hours=1)
-            labels.append(f"{i}:00")
-            
-            if stat_type == 'api':
-                count = ApiCallLog.query.filter(
-                    ApiCallLog.user_id == current_user.id,
-                    ApiCallLog.called_at >= hour_start,
-                    ApiCallLog.called_at < hour_end
-                ).count()
-            else:
-                count = LicenseKey.query.join(Project).filter(
-                    Project.user_id == current_user.id,
-                    LicenseKey.is_active == True,
-                    LicenseKey.activation_time >= hour_start,
-                    LicenseKey.activation_time < hour_end
-                ).count()
-            data.append(count)
-    
-    elif range_type == '7d':
-        # 7天数据，按天分组
-        for i in range(7):
-            day = now - timedelta(days=6-i)
-            day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
-            labels.append(day_start.strftime('%m-%d'))
-            
-            if stat_type == 'api':
-                count = ApiCallLog.query.filter(
-                    ApiCallLog.user_id == current_user.id,
-                    ApiCallLog.called_at >= day_start,
-                    ApiCallLog.called_at < day_end
-                ).count()
-            else:
-                count = LicenseKey.query.join(Project).filter(
-                    Project.user_id == current_user.id,
-                    LicenseKey.is_active == True,
-                    LicenseKey.activation_time >= day_start,
-                    LicenseKey.activation_time < day_end
-                ).count()
-            data.append(count)
-    
-    else:  # 30d
-        # 30天数据，按天分组
-        for i in range(30):
-            day = now - timedelta(days=29-i)
-            day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
-            labels.append(day_start.strftime('%m-%d'))
-            
-            if stat_type == 'api':
-                count = ApiCallLog.query.filter(
-                    ApiCallLog.user_id == current_user.id,
-                    ApiCallLog.called_at >= day_start,
-                    ApiCallLog.called_at < day_end
-                ).count()
-            else:
-                count = LicenseKey.query.join(Project).filter(
-                    Project.user_id == current_user.id,
-                    LicenseKey.is_active == True,
-                    LicenseKey.activation_time >= day_start,
-                    LicenseKey.activation_time < day_end
-                ).count()
-            data.append(count)
+        start = today
+        end = today + timedelta(days=1)
+        labels = [f"{i}:00" for i in range(24)]
+        unit = 'hour'
+    else:
+        # 7天/30天数据，按天分组
+        days = 7 if range_type == '7d' else 30
+        start = today - timedelta(days=days - 1)
+        end = today + timedelta(days=1)
+        labels = [(start + timedelta(days=i)).strftime('%m-%d') for i in range(days)]
+        unit = 'day'
+    
+    # type=all 时一次返回API调用和卡密激活两个序列
+    if stat_type == 'all':
+        series_list = ['api', 'license']
+    else:
+        series_list = ['api' if stat_type == 'api' else 'license']
     
+    if app.config['API_STATS_SOURCE'] == 'raw':
+        counts = {
+            series: load_raw_stats_series(current_user.id, series, start, end, unit)
+            for series in series_list
+        }
+    else:
+        counts = load_rollup_stats_series(current_user.id, series_list, start, end)
+    
+    # 没有数据的区间补0
+    result = {}
+    for series in series_list:
+        data = [0] * len(labels)
+        for moment, count in counts[series].items():
+            index = moment.hour if unit == 'hour' else (moment - start).days
+            if 0 <= index < len(data):
+                data[index] += count
+        result[series] = data
+    
+    if stat_type == 'all':
+        return jsonify({
+            'labels': labels,
+            'api': result['api'],
+            'license': result['license']
+        })
     return jsonify({
         'labels': labels,
-        'data': data
+        'data': result[series_list[0]]
     })
 
 def get_action_name(action_type):
@@ -1024,7 +3232,8 @@ def get_action_name(action_type):
         'deactivate': '停用',
         'ban': '封禁',
         'unban': '解封',
-        'delete': '删除'
+        'delete': '删除',
+        'extend': '延长'
     }.get(action_type, '操作')
 
 # 卡密编辑API
@@ -1048,6 +3257,13 @@ def get_license_details(license_id):
         'expiry_time': license.expiry_time.isoformat() if license.expiry_time else None
     })
 
+# 卡密生成任务进度API
+@app.route('/api/license/generation-jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_license_generation_job(job_id):
+    job = LicenseGenerationJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    return jsonify({'status': 'success', 'data': job.to_dict()})
+
 
 # 卡密激活API
 @app.route('/api/license/activate', methods=['POST'])
@@ -1059,6 +3275,21 @@ def activate_license():
     if not key or not app_id:
         return jsonify({'status': 'error', 'message': '参数不完整'}), 400
     
+    # 激活卡密
+    project = get_cached_project(app_id)
+    if not project:
+        return jsonify({'status': 'error', 'message': '卡密无效'}), 404
+    
+    activated = activate_license_atomically(key, project['id'], project['user_id'])
+    if activated:
+        return jsonify({
+            'status': 'success',
+            'expiry_time': activated.expiry_time.isoformat(),
+            'duration_minutes': activated.duration_minutes,
+            'token': issue_license_token(app_id, key, activated.activation_time, activated.expiry_time)
+        })
+    
+    # 激活失败时再查询卡密以返回具体原因
     license_key = LicenseKey.query.join(Project)\
         .filter(
             LicenseKey.key == key,
@@ -1074,21 +3305,9 @@ def activate_license():
     if not license_key.is_active:
         return jsonify({'status': 'error', 'message': '卡密未激活'}), 403
     
-    if license_key.activation_time:
-        if license_key.is_expired():
-            return jsonify({'status': 'error', 'message': '卡密已过期'}), 403
-        return jsonify({'status': 'error', 'message': '卡密已被使用'}), 403
-    
-    # 激活卡密
-    license_key.activation_time = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
-    license_key.expiry_time = license_key.calculate_expiry()
-    db.session.commit()
-    
-    return jsonify({
-        'status': 'success',
-        'expiry_time': license_key.expiry_time.isoformat(),
-        'duration_minutes': license_key.duration_minutes
-    })
+    if license_key.is_expired():
+        return jsonify({'status': 'error', 'message': '卡密已过期'}), 403
+    return jsonify({'status': 'error', 'message': '卡密已被使用'}), 403
 
 # 项目用户管理路由
 # 项目用户管理路由
@@ -1110,6 +3329,7 @@ def dashboard_project_users():
         flash('项目不存在或无权访问', 'error')
         return redirect(url_for('dashboard_projects'))
     
+    status_code = 200
     if request.method == 'POST':
         action = request.form.get('action')
         
@@ -1144,6 +3364,10 @@ def dashboard_project_users():
                 db.session.commit()
                 
                 flash(f'用户创建成功，初始密码: {password}', 'success')
+            except (PasswordHasherBusy, concurrent.futures.TimeoutError):
+                db.session.rollback()
+                status_code = 503
+                flash('服务器繁忙，请稍后再试', 'error')
             except Exception as e:
                 db.session.rollback()
                 app.logger.error(f'创建用户失败: {str(e)}')
@@ -1163,11 +3387,16 @@ def dashboard_project_users():
                     new_password = request.form.get('password')
                     if new_password:
                         user.set_password(new_password)
+                        revoke_project_user_sessions(user.id)
                     
                     db.session.commit()
                     flash('用户信息已更新', 'success')
                 else:
                     flash('用户不存在或无权操作', 'error')
+            except (PasswordHasherBusy, concurrent.futures.TimeoutError):
+                db.session.rollback()
+                status_code = 503
+                flash('服务器繁忙，请稍后再试', 'error')
             except Exception as e:
                 db.session.rollback()
                 app.logger.error(f'更新用户失败: {str(e)}')
@@ -1181,6 +3410,8 @@ def dashboard_project_users():
                 if user:
                     user.is_banned = not user.is_banned
                     user.is_active = not user.is_banned
+                    if user.is_banned:
+                        revoke_project_user_sessions(user.id)
                     db.session.commit()
                     flash(f'用户已{"封禁" if user.is_banned else "解封"}', 'success')
                 else:
@@ -1196,6 +3427,7 @@ def dashboard_project_users():
                 user = ProjectUser.query.filter_by(id=user_id, project_id=project.id).first()
                 
                 if user:
+                    revoke_project_user_sessions(user.id)
                     db.session.delete(user)
                     db.session.commit()
                     flash('用户已删除', 'success')
@@ -1221,15 +3453,112 @@ def dashboard_project_users():
                 app.logger.error(f'发送重置邮件失败: {str(e)}')
                 flash('发送重置邮件失败', 'error')
         
-        return redirect(url_for('dashboard_project_users', project_id=project.id))
+        elif action == 'send_announcement':
+            try:
+                subject = request.form.get('subject', '').strip()
+                content = request.form.get('content', '').strip()
+                
+                if not subject or not content:
+                    flash('邮件标题和公告内容不能为空', 'error')
+                elif EmailCampaign.query.filter(
+                    EmailCampaign.project_id == project.id,
+                    EmailCampaign.status.in_(['pending', 'running'])
+                ).first():
+                    flash('该项目已有正在发送的公告，请等待完成后再试', 'error')
+                else:
+                    campaign = EmailCampaign(
+                        user_id=current_user.id,
+                        project_id=project.id,
+                        subject=subject[:255],
+                        content=content
+                    )
+                    # 只发送给符合当前筛选条件的用户
+                    if request.form.get('apply_to') == 'filter':
+                        campaign.search = request.form.get('q', '').strip()[:100] or None
+                        campaign.user_status = request.form.get('status', '').strip() or None
+                    db.session.add(campaign)
+                    db.session.commit()
+                    start_email_campaign(campaign)
+                    flash('已开始在后台发送公告邮件，可在本页查看进度', 'success')
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f'创建公告群发任务失败: {str(e)}')
+                flash('创建公告群发任务失败', 'error')
+        
+        elif action == 'cancel_announcement':
+            updated = EmailCampaign.query.filter(
+                EmailCampaign.id == request.form.get('campaign_id', type=int),
+                EmailCampaign.project_id == project.id,
+                EmailCampaign.status.in_(['pending', 'running'])
+            ).update({
+                EmailCampaign.status: 'cancelled',
+                EmailCampaign.finished_at: datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+            }, synchronize_session=False)
+            db.session.commit()
+            if updated:
+                flash('公告发送已取消，正在发送的一批完成后停止', 'success')
+            else:
+                flash('公告发送任务不存在或已结束', 'error')
+        
+        # 密码哈希进程池繁忙时直接返回503和当前页面，便于客户端重试
+        if status_code == 200:
+            return redirect(url_for('dashboard_project_users', project_id=project.id))
+    
+    # 只查询列表中显示的列
+    query = db.session.query(
+        ProjectUser.id,
+        ProjectUser.uid,
+        ProjectUser.username,
+        ProjectUser.nickname,
+        ProjectUser.email,
+        ProjectUser.is_active,
+        ProjectUser.is_banned,
+        ProjectUser.created_at
+    ).filter(ProjectUser.project_id == project.id)
+    
+    query = filter_project_user_query(query, request.args)
+    
+    per_page = request.args.get('per_page', type=int)
+    if per_page not in app.config['PROJECT_USER_PAGE_SIZES']:
+        per_page = app.config['PROJECT_USER_PAGE_SIZE']
+    
+    total = query.with_entities(db.func.count(ProjectUser.id)).scalar()
+    try:
+        users, prev_cursor, next_cursor = keyset_paginate(
+            query, ProjectUser.created_at, ProjectUser.id, True, per_page,
+            after=request.args.get('after'), before=request.args.get('before')
+        )
+    except ValueError as e:
+        # 游标无效时回到第一页
+        flash(str(e), 'error')
+        users, prev_cursor, next_cursor = keyset_paginate(query, ProjectUser.created_at, ProjectUser.id, True, per_page)
     
-    users = ProjectUser.query.filter_by(project_id=project.id)\
-                          .order_by(ProjectUser.created_at.desc())\
-                          .all()
+    # 翻页链接保留筛选条件
+    filter_args = {key: value for key, value in request.args.items() if key not in ('after', 'before') and value}
+    
+    campaigns = EmailCampaign.query\
+        .filter_by(project_id=project.id)\
+        .order_by(EmailCampaign.id.desc())\
+        .limit(3)\
+        .all()
     
     return render_template('dashboard/project_users.html', 
                          project=project,
-                         users=users)
+                         users=users,
+                         total=total,
+                         per_page=per_page,
+                         page_sizes=app.config['PROJECT_USER_PAGE_SIZES'],
+                         filter_args=filter_args,
+                         prev_cursor=prev_cursor,
+                         next_cursor=next_cursor,
+                         campaigns=campaigns), status_code
+
+# 公告群发进度API
+@app.route('/api/email-campaigns/<int:campaign_id>', methods=['GET'])
+@login_required
+def get_email_campaign(campaign_id):
+    campaign = EmailCampaign.query.filter_by(id=campaign_id, user_id=current_user.id).first_or_404()
+    return jsonify({'status': 'success', 'data': campaign.to_dict()})
 
 # 项目用户API
 @app.route('/api/project-users/<int:user_id>')
@@ -1277,9 +3606,16 @@ def project_user_reset():
             flash('两次输入的密码不一致', 'error')
             return redirect(url_for('project_user_reset', token=token))
         
-        user.set_password(new_password)
+        try:
+            user.set_password(new_password)
+        except (PasswordHasherBusy, concurrent.futures.TimeoutError):
+            flash('服务器繁忙，请稍后再试', 'error')
+            return render_template('auth/project_user_reset.html',
+                                 project=project,
+                                 user=user), 503
         user.reset_token = None
         user.reset_token_expires = None
+        revoke_project_user_sessions(user.id)
         db.session.commit()
         
         flash('密码重置成功', 'success')
@@ -1294,19 +3630,19 @@ def send_project_user_reset_email(user, project):
     reset_token = user.generate_reset_token()
     reset_url = url_for('project_user_reset', token=reset_token, _external=True)
     
-    msg = Message(
-        subject=f'重置您的{project.name}账户密码',
-        recipients=[user.email],
-        html=render_template('emails/project_user_reset.html', 
+    try:
+        email_queue.enqueue(
+            'project_user_reset',
+            user.email,
+            f'重置您的{project.name}账户密码',
+            render_template('emails/project_user_reset.html', 
                           user=user, 
                           project=project,
                           reset_url=reset_url)
-    )
-    
-    try:
-        mail.send(msg)
+        )
         return True
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"发送重置邮件失败: {e}")
         return False
 
@@ -1482,12 +3818,103 @@ def get_if_force(app_id):
     """
     return get_project_data(app_id, field='force_update')
 
+@api_v1.route('/projects/<app_id>/checkUpdate', methods=['GET'])
+def check_update(app_id):
+    """
+    检查更新API（一次请求返回版本比较结果、下载地址、公告和强制更新状态）
+    ---
+    tags:
+      - 项目管理
+    parameters:
+      - name: app_id
+        in: path
+        type: string
+        required: true
+        description: 项目AppID
+      - name: current
+        in: query
+        type: string
+        required: true
+        description: 客户端当前版本号
+    responses:
+      200:
+        description: 更新检查结果
+        schema:
+          type: object
+          properties:
+            status:
+              type: string
+              example: success
+            data:
+              type: object
+              properties:
+                needs_update:
+                  type: boolean
+                  example: true
+                force:
+                  type: boolean
+                  example: false
+                latest_version:
+                  type: string
+                  example: 1.1.0
+                url:
+                  type: string
+                  example: https://example.com/download/latest
+                notice:
+                  type: string
+                  example: 重要更新说明
+      304:
+        description: 结果未变化
+      400:
+        description: 参数错误
+      404:
+        description: 项目不存在
+    """
+    try:
+        current = request.args.get('current', '').strip()
+        if not current:
+            return jsonify({
+                'status': 'error',
+                'message': 'Missing current parameter'
+            }), 400
+        
+        project = get_cached_project(app_id)
+        if not project:
+            return jsonify({
+                'status': 'error',
+                'message': 'Project not found'
+            }), 404
+        
+        latest_version = project['latest_version'] or ''
+        needs_update = bool(latest_version) and compare_versions(current, latest_version) < 0
+        response_data = {
+            'status': 'success',
+            'data': {
+                'needs_update': needs_update,
+                'force': needs_update and bool(project['force_update']),
+                'latest_version': latest_version,
+                'url': project['download_url'] or '',
+                'notice': project['announcement'] or ''
+            }
+        }
+        
+        # 结果只取决于项目数据和客户端版本，按(app_id, current)生成ETag
+        etag = hashlib.sha1(f"{project['etag']}:{current}".encode('utf-8')).hexdigest()
+        return make_cacheable_response(response_data, etag)
+    
+    except Exception as e:
+        app.logger.error(f"API Error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error'
+        }), 500
+
 def get_project_data(app_id, full_data=False, field=None):
     """
     获取项目数据的通用函数
     """
     try:
-        project = Project.query.filter_by(app_id=app_id).first()
+        project = get_cached_project(app_id)
         if not project:
             return jsonify({
                 'status': 'error',
@@ -1498,19 +3925,19 @@ def get_project_data(app_id, full_data=False, field=None):
             response_data = {
                 'status': 'success',
                 'data': {
-                    'name': project.name,
-                    'created_at': project.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                    'name': project['name'],
+                    'created_at': project['created_at'],
                     'alldata': {
-                        'latestVersion': project.latest_version or '',
-                        'updateUrl': project.download_url or '',
-                        'updateNotice': project.announcement or '',
-                        'ifForce': project.force_update or False
+                        'latestVersion': project['latest_version'] or '',
+                        'updateUrl': project['download_url'] or '',
+                        'updateNotice': project['announcement'] or '',
+                        'ifForce': project['force_update'] or False
                     }
                 }
             }
         elif field:
             # 获取单个字段的值
-            value = getattr(project, field)
+            value = project[field]
             if value is None:
                 value = '' if field != 'force_update' else False
             response_data = {
@@ -1518,7 +3945,7 @@ def get_project_data(app_id, full_data=False, field=None):
                 'data': value
             }
         
-        return jsonify(response_data)
+        return make_cacheable_response(response_data, f"{project['etag']}-{field or 'all'}")
     
     except Exception as e:
         app.logger.error(f"API Error: {str(e)}")
@@ -1649,14 +4076,14 @@ def get_license_all_data(app_id):
             }), 400
         
         # Verify project ownership
-        project = Project.query.filter_by(app_id=app_id).first()
-        if not project:
+        project, error = resolve_authorized_project(app_id, dev_id)
+        if error == 404:
             return jsonify({
                 'status': 'error',
                 'message': 'Project not found'
             }), 404
             
-        if project.owner.dev_id != dev_id:
+        if error == 403:
             return jsonify({
                 'status': 'error',
                 'message': 'Unauthorized access'
@@ -1674,42 +4101,439 @@ def get_license_all_data(app_id):
                 'message': 'License key not found'
             }), 404
         
-        # Determine status
-        if license_key.is_banned:
-            status = '已封禁'
-        elif not license_key.is_active:
-            status = '已禁用'
-        elif license_key.activation_time:
-            if license_key.is_expired():
-                status = '已过期'
+        return jsonify({
+            'status': 'success',
+            'data': license_key.to_api_dict(project.name)
+        })
+    except Exception as e:
+        app.logger.error(f"API Error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error'
+        }), 500
+
+@api_v1.route('/licenses/<app_id>/batchStatus', methods=['POST'])
+def get_license_batch_status(app_id):
+    """
+    批量获取卡密信息API（结果以流的形式返回）
+    ---
+    tags:
+      - 卡密管理
+    parameters:
+      - name: app_id
+        in: path
+        type: string
+        required: true
+        description: 项目AppID
+      - name: dev_id
+        in: formData
+        type: string
+        required: true
+        description: 开发者DevID
+      - name: keys
+        in: formData
+        type: array
+        required: true
+        description: 卡密列表，JSON数组或以逗号/换行分隔的字符串
+    responses:
+      200:
+        description: 每个卡密的信息，字段与alldata相同，未找到的卡密带error字段
+        schema:
+          type: object
+          properties:
+            status:
+              type: string
+              example: success
+            data:
+              type: array
+              items:
+                type: object
+      400:
+        description: 参数错误或卡密数量超出上限
+      404:
+        description: 项目不存在
+      403:
+        description: 无权限访问
+    """
+    try:
+        data = request.get_json(silent=True) or request.form
+        dev_id = data.get('dev_id')
+        keys = parse_request_keys(data)
+        
+        if not dev_id or not keys:
+            return jsonify({
+                'status': 'error',
+                'message': 'Missing dev_id or keys parameter'
+            }), 400
+        
+        max_keys = app.config['LICENSE_BATCH_MAX_KEYS']
+        if len(keys) > max_keys:
+            return jsonify({
+                'status': 'error',
+                'message': f'Too many keys, at most {max_keys} per request'
+            }), 400
+        
+        # Verify project ownership
+        project, error = resolve_authorized_project(app_id, dev_id)
+        if error == 404:
+            return jsonify({
+                'status': 'error',
+                'message': 'Project not found'
+            }), 404
+            
+        if error == 403:
+            return jsonify({
+                'status': 'error',
+                'message': 'Unauthorized access'
+            }), 403
+    except Exception as e:
+        app.logger.error(f"API Error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error'
+        }), 500
+    
+    project_id, project_name = project.id, project.name
+    chunk_size = app.config['LICENSE_BATCH_CHUNK_SIZE']
+    
+    def generate():
+        yield '{"status": "success", "data": ['
+        separator = ''
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            found = {
+                license_key.key: license_key
+                for license_key in LicenseKey.query.filter(
+                    LicenseKey.project_id == project_id,
+                    LicenseKey.key.in_(chunk)
+                )
+            }
+            for key in chunk:
+                license_key = found.get(key)
+                if license_key:
+                    item = license_key.to_api_dict(project_name)
+                else:
+                    item = {'key': key, 'error': 'License key not found'}
+                yield separator + app.json.dumps(item)
+                separator = ', '
+            # 每批处理完释放ORM对象，保证内存占用与批量大小无关
+            db.session.expunge_all()
+        yield ']}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@api_v1.route('/licenses/<app_id>/batchActivate', methods=['POST'])
+def batch_activate_license_keys(app_id):
+    """
+    批量激活卡密API
+    ---
+    tags:
+      - 卡密管理
+    parameters:
+      - name: app_id
+        in: path
+        type: string
+        required: true
+        description: 项目AppID
+      - name: dev_id
+        in: formData
+        type: string
+        required: true
+        description: 开发者DevID
+      - name: keys
+        in: formData
+        type: array
+        required: true
+        description: 卡密列表，JSON数组或以逗号/换行分隔的字符串
+    responses:
+      200:
+        description: 批量激活结果
+        schema:
+          type: object
+          properties:
+            status:
+              type: string
+              example: success
+            data:
+              type: object
+              properties:
+                activated:
+                  type: array
+                  items:
+                    type: object
+                rejected:
+                  type: array
+                  items:
+                    type: object
+      400:
+        description: 参数错误或卡密数量超出上限
+      404:
+        description: 项目不存在
+      403:
+        description: 无权限访问
+    """
+    try:
+        data = request.get_json(silent=True) or request.form
+        dev_id = data.get('dev_id')
+        keys = parse_request_keys(data)
+        
+        if not dev_id or not keys:
+            return jsonify({
+                'status': 'error',
+                'message': 'Missing dev_id or keys parameter'
+            }), 400
+        
+        max_keys = app.config['LICENSE_BATCH_MAX_KEYS']
+        if len(keys) > max_keys:
+            return jsonify({
+                'status': 'error',
+                'message': f'Too many keys, at most {max_keys} per request'
+            }), 400
+        
+        # Verify project ownership
+        project, error = resolve_authorized_project(app_id, dev_id)
+        if error == 404:
+            return jsonify({
+                'status': 'error',
+                'message': 'Project not found'
+            }), 404
+            
+        if error == 403:
+            return jsonify({
+                'status': 'error',
+                'message': 'Unauthorized access'
+            }), 403
+        
+        now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None, microsecond=0)
+        chunk_size = app.config['LICENSE_BATCH_CHUNK_SIZE']
+        activated = []
+        rejected = []
+        
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            rows = {
+                row.key: row
+                for row in db.session.query(
+                    LicenseKey.key,
+                    LicenseKey.is_banned,
+                    LicenseKey.is_active,
+                    LicenseKey.activation_time
+                ).filter(
+                    LicenseKey.project_id == project.id,
+                    LicenseKey.key.in_(chunk)
+                )
+            }
+            
+            candidates = []
+            for key in chunk:
+                row = rows.get(key)
+                if not row:
+                    rejected.append({'key': key, 'reason': 'License key not found'})
+                elif row.is_banned:
+                    rejected.append({'key': key, 'reason': 'License key is banned'})
+                elif not row.is_active:
+                    rejected.append({'key': key, 'reason': 'License key is disabled'})
+                elif row.activation_time:
+                    rejected.append({'key': key, 'reason': 'License key already activated'})
+                else:
+                    candidates.append(key)
+            
+            if not candidates:
+                continue
+            
+            # 过期时间由数据库根据duration_minutes计算；条件中再次检查状态，并发请求中每个卡密只有一个能激活成功。
+            # 是否由本次请求激活只看UPDATE自身的结果，不能按activation_time判断（同一秒内的并发请求时间相同）
+            statement = db.update(LicenseKey)\
+                .where(
+                    LicenseKey.project_id == project.id,
+                    db.or_(LicenseKey.is_banned == False, LicenseKey.is_banned.is_(None)),
+                    LicenseKey.is_active == True,
+                    LicenseKey.activation_time.is_(None)
+                )\
+                .values(
+                    activation_time=now,
+                    expiry_time=sql_add_minutes(now, LicenseKey.duration_minutes)
+                )\
+                .execution_options(synchronize_session=False)
+            
+            if db.engine.dialect.update_returning:
+                # 支持RETURNING的数据库一条UPDATE激活整批卡密，只返回本次更新的行
+                results = {
+                    row.key: row
+                    for row in db.session.execute(
+                        statement.where(LicenseKey.key.in_(candidates))
+                        .returning(LicenseKey.key, LicenseKey.activation_time, LicenseKey.expiry_time)
+                    )
+                }
             else:
-                status = '已激活'
-        else:
-            status = '可用'
+                updated = [
+                    key for key in candidates
+                    if db.session.execute(statement.where(LicenseKey.key == key)).rowcount == 1
+                ]
+                results = {
+                    row.key: row
+                    for row in db.session.query(
+                        LicenseKey.key,
+                        LicenseKey.activation_time,
+                        LicenseKey.expiry_time
+                    ).filter(
+                        LicenseKey.project_id == project.id,
+                        LicenseKey.key.in_(updated)
+                    )
+                } if updated else {}
+            
+            for key in candidates:
+                row = results.get(key)
+                if row:
+                    activated.append({
+                        'key': key,
+                        'expiry_time': row.expiry_time.isoformat(),
+                        'token': issue_license_token(app_id, key, row.activation_time, row.expiry_time)
+                    })
+                else:
+                    rejected.append({'key': key, 'reason': 'License key already activated'})
+        
+        if activated:
+            record_activations(project.user_id, now, len(activated))
+        db.session.commit()
         
         return jsonify({
             'status': 'success',
             'data': {
-                'status': status,
-                'key': license_key.key,
-                'created_at': license_key.created_at.isoformat(),
-                'duration_minutes': license_key.duration_minutes,
+                'activated_count': len(activated),
+                'rejected_count': len(rejected),
+                'activated': activated,
+                'rejected': rejected,
+                'project_name': project.name
+            }
+        })
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"API Error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Internal server error'
+        }), 500
+
+@api_v1.route('/licenses/<app_id>/activate', methods=['POST'])
+def activate_license_key(app_id):
+    """
+    激活卡密API
+    ---
+    tags:
+      - 卡密管理
+    parameters:
+      - name: app_id
+        in: path
+        type: string
+        required: true
+        description: 项目AppID
+      - name: dev_id
+        in: formData
+        type: string
+        required: true
+        description: 开发者DevID
+      - name: key
+        in: formData
+        type: string
+        required: true
+        description: 卡密
+    responses:
+      200:
+        description: 卡密激活结果
+        schema:
+          type: object
+          properties:
+            status:
+              type: string
+              example: success
+            data:
+              type: object
+              properties:
+                success:
+                  type: boolean
+                  example: true
+                duration_minutes:
+                  type: integer
+                  example: 1440
+                expiry_time:
+                  type: string
+                  format: date-time
+                  example: "2023-01-03T00:00:00"
+                project_name:
+                  type: string
+                  example: 我的项目
+                token:
+                  type: string
+                  description: Ed25519签名的离线卡密令牌，可用tokenKey接口公开的公钥在本地校验；服务端未配置SECRET_KEY时为null
+      404:
+        description: 项目或卡密不存在
+      403:
+        description: 无权限访问或卡密不可用
+    """
+    try:
+        dev_id = request.form.get('dev_id')
+        key = request.form.get('key')
+        
+        if not dev_id or not key:
+            return jsonify({
+                'status': 'error',
+                'message': 'Missing dev_id or key parameter'
+            }), 400
+        
+        # Verify project ownership
+        project, error = resolve_authorized_project(app_id, dev_id)
+        if error == 404:
+            return jsonify({
+                'status': 'error',
+                'message': 'Project not found'
+            }), 404
+            
+        if error == 403:
+            return jsonify({
+                'status': 'error',
+                'message': 'Unauthorized access'
+            }), 403
+        
+        # Activate license
+        activated = activate_license_atomically(key, project.id, project.user_id)
+        if not activated:
+            exists = db.session.query(LicenseKey.id).filter_by(
+                key=key,
+                project_id=project.id
+            ).first()
+            if not exists:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'License key not found'
+                }), 404
+            return jsonify({
+                'status': 'error',
+                'message': 'License key cannot be activated'
+            }), 403
+        
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'success': True,
+                'duration_minutes': activated.duration_minutes,
+                'expiry_time': activated.expiry_time.isoformat(),
                 'project_name': project.name,
-                'activation_time': license_key.activation_time.isoformat() if license_key.activation_time else None,
-                'expiry_time': license_key.expiry_time.isoformat() if license_key.expiry_time else None
+                'token': issue_license_token(app_id, key, activated.activation_time, activated.expiry_time)
             }
         })
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"API Error: {str(e)}")
         return jsonify({
             'status': 'error',
             'message': 'Internal server error'
         }), 500
 
-@api_v1.route('/licenses/<app_id>/activate', methods=['POST'])
-def activate_license_key(app_id):
+@api_v1.route('/licenses/<app_id>/token', methods=['POST'])
+def renew_license_token(app_id):
     """
-    激活卡密API
+    续签离线卡密令牌API
     ---
     tags:
       - 卡密管理
@@ -1731,7 +4555,7 @@ def activate_license_key(app_id):
         description: 卡密
     responses:
       200:
-        description: 卡密激活结果
+        description: 新的离线卡密令牌
         schema:
           type: object
           properties:
@@ -1741,23 +4565,18 @@ def activate_license_key(app_id):
             data:
               type: object
               properties:
-                success:
-                  type: boolean
-                  example: true
-                duration_minutes:
-                  type: integer
-                  example: 1440
+                token:
+                  type: string
                 expiry_time:
                   type: string
                   format: date-time
                   example: "2023-01-03T00:00:00"
-                project_name:
-                  type: string
-                  example: 我的项目
       404:
         description: 项目或卡密不存在
       403:
-        description: 无权限访问或卡密不可用
+        description: 无权限访问或卡密未激活、已过期、已禁用
+      503:
+        description: 服务端未配置SECRET_KEY，不签发离线令牌
     """
     try:
         dev_id = request.form.get('dev_id')
@@ -1770,14 +4589,14 @@ def activate_license_key(app_id):
             }), 400
         
         # Verify project ownership
-        project = Project.query.filter_by(app_id=app_id).first()
-        if not project:
+        project, error = resolve_authorized_project(app_id, dev_id)
+        if error == 404:
             return jsonify({
                 'status': 'error',
                 'message': 'Project not found'
             }), 404
             
-        if project.owner.dev_id != dev_id:
+        if error == 403:
             return jsonify({
                 'status': 'error',
                 'message': 'Unauthorized access'
@@ -1795,35 +4614,96 @@ def activate_license_key(app_id):
                 'message': 'License key not found'
             }), 404
         
-        # Check if license can be activated
-        if license_key.is_banned or not license_key.is_active or license_key.activation_time:
+        # 只有处于已激活状态的卡密可以续签令牌
+        if license_key.get_status() != '已激活':
             return jsonify({
                 'status': 'error',
-                'message': 'License key cannot be activated'
+                'message': 'License key is not in activated state'
             }), 403
         
-        # Activate license
-        license_key.activation_time = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
-        license_key.expiry_time = license_key.calculate_expiry()
-        db.session.commit()
+        token = issue_license_token(app_id, key, license_key.activation_time, license_key.expiry_time)
+        if token is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'License tokens are not available on this server'
+            }), 503
         
         return jsonify({
             'status': 'success',
             'data': {
-                'success': True,
-                'duration_minutes': license_key.duration_minutes,
-                'expiry_time': license_key.expiry_time.isoformat(),
-                'project_name': project.name
+                'token': token,
+                'expiry_time': license_key.expiry_time.isoformat()
             }
         })
     except Exception as e:
-        db.session.rollback()
         app.logger.error(f"API Error: {str(e)}")
         return jsonify({
             'status': 'error',
             'message': 'Internal server error'
         }), 500
 
+@api_v1.route('/licenses/<app_id>/tokenKey', methods=['GET'])
+def get_license_token_key(app_id):
+    """
+    获取离线卡密令牌校验公钥API
+    ---
+    tags:
+      - 卡密管理
+    parameters:
+      - name: app_id
+        in: path
+        type: string
+        required: true
+        description: 项目AppID
+    responses:
+      200:
+        description: 令牌签名算法和项目的Ed25519公钥，公钥可以公开并内置到客户端
+        schema:
+          type: object
+          properties:
+            status:
+              type: string
+              example: success
+            data:
+              type: object
+              properties:
+                algorithm:
+                  type: string
+                  example: EdDSA
+                key:
+                  type: string
+                  description: base64url编码的32字节Ed25519公钥
+                jwk:
+                  type: object
+                  description: JWK格式的公钥
+      404:
+        description: 项目不存在
+      503:
+        description: 服务端未配置令牌签名密钥
+    """
+    if not get_cached_project(app_id):
+        return jsonify({
+            'status': 'error',
+            'message': 'Project not found'
+        }), 404
+    
+    private_key = get_license_signing_key(app_id) if token_signing_enabled() else None
+    if private_key is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'License tokens are not available on this server'
+        }), 503
+    
+    public_key = base64url_encode(private_key.public_key().public_bytes_raw())
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'algorithm': 'EdDSA',
+            'key': public_key,
+            'jwk': {'kty': 'OKP', 'crv': 'Ed25519', 'x': public_key}
+        }
+    })
+
 @api_v1.route('/licenses/<app_id>/deactivate', methods=['POST'])
 def deactivate_license_key(app_id):
     """
@@ -1884,14 +4764,14 @@ def deactivate_license_key(app_id):
             }), 400
         
         # Verify project ownership
-        project = Project.query.filter_by(app_id=app_id).first()
-        if not project:
+        project, error = resolve_authorized_project(app_id, dev_id)
+        if error == 404:
             return jsonify({
                 'status': 'error',
                 'message': 'Project not found'
             }), 404
             
-        if project.owner.dev_id != dev_id:
+        if error == 403:
             return jsonify({
                 'status': 'error',
                 'message': 'Unauthorized access'
@@ -1990,14 +4870,14 @@ def delete_license_key(app_id):
             }), 400
         
         # Verify project ownership
-        project = Project.query.filter_by(app_id=app_id).first()
-        if not project:
+        project, error = resolve_authorized_project(app_id, dev_id)
+        if error == 404:
             return jsonify({
                 'status': 'error',
                 'message': 'Project not found'
             }), 404
             
-        if project.owner.dev_id != dev_id:
+        if error == 403:
             return jsonify({
                 'status': 'error',
                 'message': 'Unauthorized access'
@@ -2092,14 +4972,14 @@ def disable_license_key(app_id):
             }), 400
         
         # Verify project ownership
-        project = Project.query.filter_by(app_id=app_id).first()
-        if not project:
+        project, error = resolve_authorized_project(app_id, dev_id)
+        if error == 404:
             return jsonify({
                 'status': 'error',
                 'message': 'Project not found'
             }), 404
             
-        if project.owner.dev_id != dev_id:
+        if error == 403:
             return jsonify({
                 'status': 'error',
                 'message': 'Unauthorized access'
@@ -2193,14 +5073,14 @@ def enable_license_key(app_id):
             }), 400
         
         # Verify project ownership
-        project = Project.query.filter_by(app_id=app_id).first()
-        if not project:
+        project, error = resolve_authorized_project(app_id, dev_id)
+        if error == 404:
             return jsonify({
                 'status': 'error',
                 'message': 'Project not found'
             }), 404
             
-        if project.owner.dev_id != dev_id:
+        if error == 403:
             return jsonify({
                 'status': 'error',
                 'message': 'Unauthorized access'
@@ -2303,14 +5183,14 @@ def ban_license_key(app_id):
             }), 400
         
         # Verify project ownership
-        project = Project.query.filter_by(app_id=app_id).first()
-        if not project:
+        project, error = resolve_authorized_project(app_id, dev_id)
+        if error == 404:
             return jsonify({
                 'status': 'error',
                 'message': 'Project not found'
             }), 404
             
-        if project.owner.dev_id != dev_id:
+        if error == 403:
             return jsonify({
                 'status': 'error',
                 'message': 'Unauthorized access'
@@ -2409,14 +5289,14 @@ def unban_license_key(app_id):
             }), 400
         
         # Verify project ownership
-        project = Project.query.filter_by(app_id=app_id).first()
-        if not project:
+        project, error = resolve_authorized_project(app_id, dev_id)
+        if error == 404:
             return jsonify({
                 'status': 'error',
                 'message': 'Project not found'
             }), 404
             
-        if project.owner.dev_id != dev_id:
+        if error == 403:
             return jsonify({
                 'status': 'error',
                 'message': 'Unauthorized access'
@@ -2539,6 +5419,86 @@ def check_user_registration(app_id):
         'data': '已注册'
     })
 
+def get_bearer_token():
+    """从Authorization请求头（Bearer）或access_token参数中读取项目用户访问令牌"""
+    authorization = request.headers.get('Authorization', '')
+    if authorization[:7].lower() == 'bearer ':
+        return authorization[7:].strip()
+    return request.args.get('access_token')
+
+def find_project_user_for_read(app_id):
+    """
+    查询类接口定位项目用户：携带访问令牌时无状态校验令牌并只返回令牌所属用户，
+    否则使用dev_id加user_id、username、uid或email查询。返回(user, 错误响应)
+    """
+    token = get_bearer_token()
+    if token:
+        try:
+            claims = verify_session_token(app_id, token)
+        except ValueError as e:
+            return None, (jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 401)
+        
+        user = db.session.get(ProjectUser, claims['sub'])
+        if not user or user.project_id != claims['pid']:
+            return None, (jsonify({
+                'status': 'error',
+                'message': '用户未找到'
+            }), 404)
+        return user, None
+    
+    dev_id = request.args.get('dev_id')
+    user_id = request.args.get('user_id')
+    username = request.args.get('username')
+    uid = request.args.get('uid')
+    email = request.args.get('email')
+    
+    if not dev_id:
+        return None, (jsonify({
+            'status': 'error',
+            'message': '必须提供dev_id'
+        }), 400)
+    
+    if not (user_id or username or uid or email):
+        return None, (jsonify({
+            'status': 'error',
+            'message': '必须提供user_id、username、uid或email中的一个参数'
+        }), 400)
+    
+    project, error = resolve_authorized_project(app_id, dev_id)
+    if error == 404:
+        return None, (jsonify({
+            'status': 'error',
+            'message': '项目不存在'
+        }), 404)
+    
+    if error == 403:
+        return None, (jsonify({
+            'status': 'error',
+            'message': '无权限访问'
+        }), 403)
+    
+    query = ProjectUser.query.filter_by(project_id=project.id)
+    
+    if user_id:
+        user = query.filter_by(id=user_id).first()
+    elif username:
+        user = query.filter_by(username=username).first()
+    elif uid:
+        user = query.filter_by(uid=uid).first()
+    else:
+        user = query.filter_by(email=email).first()
+    
+    if not user:
+        return None, (jsonify({
+            'status': 'error',
+            'message': '用户未找到'
+        }), 404)
+    
+    return user, None
+
 @api_v1.route('/project-users/<app_id>/alldata', methods=['GET'])
 def get_user_all_data(app_id):
     """
@@ -2552,11 +5512,14 @@ def get_user_all_data(app_id):
         type: string
         required: true
         description: 项目AppID
+      - name: Authorization
+        in: header
+        type: string
+        description: 登录返回的访问令牌，格式为"Bearer <access_token>"，提供时无需dev_id且只能查询令牌所属用户
       - name: dev_id
         in: query
         type: string
-        required: true
-        description: 开发者DevID
+        description: 开发者DevID，未提供访问令牌时必填
       - name: user_id
         in: query
         type: integer
@@ -2618,58 +5581,16 @@ def get_user_all_data(app_id):
                   example: "2023-01-01T00:00:00"
       400:
         description: 参数错误
+      401:
+        description: 访问令牌无效、已过期或已被吊销
       403:
         description: 无权限访问
       404:
         description: 用户未找到
     """
-    dev_id = request.args.get('dev_id')
-    user_id = request.args.get('user_id')
-    username = request.args.get('username')
-    uid = request.args.get('uid')
-    email = request.args.get('email')
-    
-    if not dev_id:
-        return jsonify({
-            'status': 'error',
-            'message': '必须提供dev_id'
-        }), 400
-    
-    if not (user_id or username or uid or email):
-        return jsonify({
-            'status': 'error',
-            'message': '必须提供user_id、username、uid或email中的一个参数'
-        }), 400
-    
-    project = Project.query.filter_by(app_id=app_id).first()
-    if not project:
-        return jsonify({
-            'status': 'error',
-            'message': '项目不存在'
-        }), 404
-    
-    if project.owner.dev_id != dev_id:
-        return jsonify({
-            'status': 'error',
-            'message': '无权限访问'
-        }), 403
-    
-    query = ProjectUser.query.filter_by(project_id=project.id)
-    
-    if user_id:
-        user = query.filter_by(id=user_id).first()
-    elif username:
-        user = query.filter_by(username=username).first()
-    elif uid:
-        user = query.filter_by(uid=uid).first()
-    else:
-        user = query.filter_by(email=email).first()
-    
-    if not user:
-        return jsonify({
-            'status': 'error',
-            'message': '用户未找到'
-        }), 404
+    user, error_response = find_project_user_for_read(app_id)
+    if error_response:
+        return error_response
     
     return jsonify({
         'status': 'success',
@@ -2700,94 +5621,55 @@ def get_user_register_date(app_id):
         type: string
         required: true
         description: 项目AppID
+      - name: Authorization
+        in: header
+        type: string
+        description: 登录返回的访问令牌，格式为"Bearer <access_token>"，提供时无需dev_id且只能查询令牌所属用户
       - name: dev_id
         in: query
         type: string
-        required: true
-        description: 开发者DevID
+        description: 开发者DevID，未提供访问令牌时必填
       - name: user_id
         in: query
         type: integer
         description: 用户ID
-      - name: username
-        in: query
-        type: string
-        description: 用户名
-      - name: uid
-        in: query
-        type: string
-        description: 用户UID
-      - name: email
-        in: query
-        type: string
-        description: 用户邮箱
-    responses:
-      200:
-        description: 用户注册日期
-        schema:
-          type: object
-          properties:
-            status:
-              type: string
-              example: success
-            data:
-              type: string
-              format: date-time
-              example: "2023-01-01T00:00:00"
-      400:
-        description: 参数错误
-      403:
-        description: 无权限访问
-      404:
-        description: 用户未找到
-    """
-    dev_id = request.args.get('dev_id')
-    user_id = request.args.get('user_id')
-    username = request.args.get('username')
-    uid = request.args.get('uid')
-    email = request.args.get('email')
-    
-    if not dev_id:
-        return jsonify({
-            'status': 'error',
-            'message': '必须提供dev_id'
-        }), 400
-    
-    if not (user_id or username or uid or email):
-        return jsonify({
-            'status': 'error',
-            'message': '必须提供user_id、username、uid或email中的一个参数'
-        }), 400
-    
-    project = Project.query.filter_by(app_id=app_id).first()
-    if not project:
-        return jsonify({
-            'status': 'error',
-            'message': '项目不存在'
-        }), 404
-    
-    if project.owner.dev_id != dev_id:
-        return jsonify({
-            'status': 'error',
-            'message': '无权限访问'
-        }), 403
-    
-    query = ProjectUser.query.filter_by(project_id=project.id)
-    
-    if user_id:
-        user = query.filter_by(id=user_id).first()
-    elif username:
-        user = query.filter_by(username=username).first()
-    elif uid:
-        user = query.filter_by(uid=uid).first()
-    else:
-        user = query.filter_by(email=email).first()
-    
-    if not user:
-        return jsonify({
-            'status': 'error',
-            'message': '用户未找到'
-        }), 404
+      - name: username
+        in: query
+        type: string
+        description: 用户名
+      - name: uid
+        in: query
+        type: string
+        description: 用户UID
+      - name: email
+        in: query
+        type: string
+        description: 用户邮箱
+    responses:
+      200:
+        description: 用户注册日期
+        schema:
+          type: object
+          properties:
+            status:
+              type: string
+              example: success
+            data:
+              type: string
+              format: date-time
+              example: "2023-01-01T00:00:00"
+      400:
+        description: 参数错误
+      401:
+        description: 访问令牌无效、已过期或已被吊销
+      403:
+        description: 无权限访问
+      404:
+        description: 用户未找到
+    """
+    user, error_response = find_project_user_for_read(app_id)
+    if error_response:
+        return error_response
     
     return jsonify({
         'status': 'success',
@@ -2807,11 +5689,14 @@ def get_user_last_login(app_id):
         type: string
         required: true
         description: 项目AppID
+      - name: Authorization
+        in: header
+        type: string
+        description: 登录返回的访问令牌，格式为"Bearer <access_token>"，提供时无需dev_id且只能查询令牌所属用户
       - name: dev_id
         in: query
         type: string
-        required: true
-        description: 开发者DevID
+        description: 开发者DevID，未提供访问令牌时必填
       - name: user_id
         in: query
         type: integer
@@ -2849,58 +5734,16 @@ def get_user_last_login(app_id):
                   example: "127.0.0.1"
       400:
         description: 参数错误
+      401:
+        description: 访问令牌无效、已过期或已被吊销
       403:
         description: 无权限访问
       404:
         description: 用户未找到
     """
-    dev_id = request.args.get('dev_id')
-    user_id = request.args.get('user_id')
-    username = request.args.get('username')
-    uid = request.args.get('uid')
-    email = request.args.get('email')
-    
-    if not dev_id:
-        return jsonify({
-            'status': 'error',
-            'message': '必须提供dev_id'
-        }), 400
-    
-    if not (user_id or username or uid or email):
-        return jsonify({
-            'status': 'error',
-            'message': '必须提供user_id、username、uid或email中的一个参数'
-        }), 400
-    
-    project = Project.query.filter_by(app_id=app_id).first()
-    if not project:
-        return jsonify({
-            'status': 'error',
-            'message': '项目不存在'
-        }), 404
-    
-    if project.owner.dev_id != dev_id:
-        return jsonify({
-            'status': 'error',
-            'message': '无权限访问'
-        }), 403
-    
-    query = ProjectUser.query.filter_by(project_id=project.id)
-    
-    if user_id:
-        user = query.filter_by(id=user_id).first()
-    elif username:
-        user = query.filter_by(username=username).first()
-    elif uid:
-        user = query.filter_by(uid=uid).first()
-    else:
-        user = query.filter_by(email=email).first()
-    
-    if not user:
-        return jsonify({
-            'status': 'error',
-            'message': '用户未找到'
-        }), 404
+    user, error_response = find_project_user_for_read(app_id)
+    if error_response:
+        return error_response
     
     return jsonify({
         'status': 'success',
@@ -2987,14 +5830,14 @@ def ban_user(app_id):
             'message': '必须提供user_id、username、uid或email中的一个参数'
         }), 400
     
-    project = Project.query.filter_by(app_id=app_id).first()
-    if not project:
+    project, error = resolve_authorized_project(app_id, dev_id)
+    if error == 404:
         return jsonify({
             'status': 'error',
             'message': '项目不存在'
         }), 404
     
-    if project.owner.dev_id != dev_id:
+    if error == 403:
         return jsonify({
             'status': 'error',
             'message': '无权限访问'
@@ -3020,6 +5863,7 @@ def ban_user(app_id):
     try:
         user.is_banned = True
         user.is_active = False
+        revoke_project_user_sessions(user.id)
         db.session.commit()
         
         return jsonify({
@@ -3114,14 +5958,14 @@ def unban_user(app_id):
             'message': '必须提供user_id、username、uid或email中的一个参数'
         }), 400
     
-    project = Project.query.filter_by(app_id=app_id).first()
-    if not project:
+    project, error = resolve_authorized_project(app_id, dev_id)
+    if error == 404:
         return jsonify({
             'status': 'error',
             'message': '项目不存在'
         }), 404
     
-    if project.owner.dev_id != dev_id:
+    if error == 403:
         return jsonify({
             'status': 'error',
             'message': '无权限访问'
@@ -3240,14 +6084,14 @@ def delete_user(app_id):
             'message': '必须提供user_id、username、uid或email中的一个参数'
         }), 400
     
-    project = Project.query.filter_by(app_id=app_id).first()
-    if not project:
+    project, error = resolve_authorized_project(app_id, dev_id)
+    if error == 404:
         return jsonify({
             'status': 'error',
             'message': '项目不存在'
         }), 404
     
-    if project.owner.dev_id != dev_id:
+    if error == 403:
         return jsonify({
             'status': 'error',
             'message': '无权限访问'
@@ -3272,6 +6116,7 @@ def delete_user(app_id):
     
     try:
         username = user.username
+        revoke_project_user_sessions(user.id)
         db.session.delete(user)
         db.session.commit()
         
@@ -3367,14 +6212,14 @@ def send_reset_email(app_id):
             'message': '必须提供user_id、username、uid或email中的一个参数'
         }), 400
     
-    project = Project.query.filter_by(app_id=app_id).first()
-    if not project:
+    project, error = resolve_authorized_project(app_id, dev_id)
+    if error == 404:
         return jsonify({
             'status': 'error',
             'message': '项目不存在'
         }), 404
     
-    if project.owner.dev_id != dev_id:
+    if error == 403:
         return jsonify({
             'status': 'error',
             'message': '无权限访问'
@@ -3469,6 +6314,19 @@ def user_login(app_id):
                 last_login_ip:
                   type: string
                   example: "127.0.0.1"
+                access_token:
+                  type: string
+                  description: 访问令牌，查询接口通过Authorization请求头携带，无需再提交密码
+                refresh_token:
+                  type: string
+                  description: 刷新令牌，访问令牌过期后用于换取新令牌
+                token_type:
+                  type: string
+                  example: "Bearer"
+                expires_in:
+                  type: integer
+                  description: 访问令牌有效期（秒）
+                  example: 3600
       400:
         description: 参数错误
       401:
@@ -3511,14 +6369,24 @@ def user_login(app_id):
             'message': '用户已被封禁'
         }), 403
     
-    if not user.check_password(password):
+    try:
+        password_valid = user.check_password(password)
+    except (PasswordHasherBusy, concurrent.futures.TimeoutError):
+        response = jsonify({
+            'status': 'error',
+            'message': '登录请求过多，请稍后再试'
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    
+    if not password_valid:
         return jsonify({
             'status': 'error',
             'message': '用户名或密码错误'
         }), 401
     
     try:
-        # 更新最后登录信息
+        # 更新最后登录信息，check_password升级的密码哈希一并提交
         user.last_login = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
         user.last_login_ip = request.remote_addr
         db.session.commit()
@@ -3530,7 +6398,8 @@ def user_login(app_id):
                 'user_id': user.id,
                 'username': user.username,
                 'last_login': user.last_login.isoformat(),
-                'last_login_ip': user.last_login_ip
+                'last_login_ip': user.last_login_ip,
+                **issue_session_tokens(app_id, user)
             }
         })
     except Exception as e:
@@ -3541,6 +6410,182 @@ def user_login(app_id):
             'message': '登录失败'
         }), 500
 
+@api_v1.route('/project-users/<app_id>/refresh', methods=['POST'])
+def user_refresh_token(app_id):
+    """
+    刷新用户会话令牌API
+    ---
+    tags:
+      - 用户管理
+    parameters:
+      - name: app_id
+        in: path
+        type: string
+        required: true
+        description: 项目AppID
+      - name: refresh_token
+        in: formData
+        type: string
+        required: true
+        description: 登录或上次刷新返回的刷新令牌，使用后即失效
+    responses:
+      200:
+        description: 新的访问令牌和刷新令牌
+        schema:
+          type: object
+          properties:
+            status:
+              type: string
+              example: success
+            data:
+              type: object
+              properties:
+                access_token:
+                  type: string
+                refresh_token:
+                  type: string
+                token_type:
+                  type: string
+                  example: "Bearer"
+                expires_in:
+                  type: integer
+                  example: 3600
+      400:
+        description: 参数错误
+      401:
+        description: 刷新令牌无效、已过期或已被吊销
+      403:
+        description: 用户被封禁
+      404:
+        description: 用户未找到
+    """
+    refresh_token = request.form.get('refresh_token')
+    if not refresh_token:
+        return jsonify({
+            'status': 'error',
+            'message': '必须提供refresh_token'
+        }), 400
+    
+    try:
+        claims = verify_session_token(app_id, refresh_token, typ='refresh')
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 401
+    
+    user = db.session.get(ProjectUser, claims['sub'])
+    if not user or user.project_id != claims['pid']:
+        return jsonify({
+            'status': 'error',
+            'message': '用户未找到'
+        }), 404
+    
+    if user.is_banned:
+        return jsonify({
+            'status': 'error',
+            'message': '用户已被封禁'
+        }), 403
+    
+    # 其他进程的内存吊销名单最多延迟PROJECT_USER_DENYLIST_REFRESH秒，以数据库中的会话代数为准，
+    # 改密或封禁之前签发的刷新令牌不能换出新代数的令牌
+    if claims.get('gen', 0) < (user.session_generation or 0):
+        return jsonify({
+            'status': 'error',
+            'message': '令牌已被吊销'
+        }), 401
+    
+    try:
+        # 刷新令牌只能使用一次，并发使用同一刷新令牌时只有一个请求能写入吊销记录
+        if not revoke_session_token(claims):
+            return jsonify({
+                'status': 'error',
+                'message': '令牌已被吊销'
+            }), 401
+        tokens = issue_session_tokens(app_id, user)
+        
+        return jsonify({
+            'status': 'success',
+            'data': tokens
+        })
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"刷新令牌失败: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': '刷新令牌失败'
+        }), 500
+
+@api_v1.route('/project-users/<app_id>/logout', methods=['POST'])
+def user_logout(app_id):
+    """
+    用户退出登录API
+    ---
+    tags:
+      - 用户管理
+    parameters:
+      - name: app_id
+        in: path
+        type: string
+        required: true
+        description: 项目AppID
+      - name: Authorization
+        in: header
+        type: string
+        required: true
+        description: 访问令牌，格式为"Bearer <access_token>"
+      - name: refresh_token
+        in: formData
+        type: string
+        description: 同时吊销的刷新令牌
+    responses:
+      200:
+        description: 退出成功，提交的令牌已吊销
+      401:
+        description: 访问令牌无效、已过期或已被吊销
+    """
+    token = get_bearer_token()
+    if not token:
+        return jsonify({
+            'status': 'error',
+            'message': '必须提供访问令牌'
+        }), 401
+    
+    try:
+        claims = verify_session_token(app_id, token)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 401
+    
+    refresh_claims = None
+    refresh_token = request.form.get('refresh_token')
+    if refresh_token:
+        try:
+            refresh_claims = verify_session_token(app_id, refresh_token, typ='refresh')
+        except ValueError:
+            pass
+    
+    try:
+        # 令牌已被吊销（如重复退出）时视为成功
+        revoke_session_token(claims)
+        # 只吊销属于同一用户的刷新令牌
+        if refresh_claims and refresh_claims['sub'] == claims['sub']:
+            revoke_session_token(refresh_claims)
+        
+        return jsonify({
+            'status': 'success',
+            'message': '已退出登录'
+        })
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"退出登录失败: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': '退出登录失败'
+        }), 500
+
 @api_v1.route('/project-users/<app_id>/register', methods=['POST'])
 def user_register(app_id):
     """
@@ -3605,6 +6650,8 @@ def user_register(app_id):
         description: 参数错误
       409:
         description: 用户名或邮箱已存在
+      503:
+        description: 密码哈希计算繁忙，请根据Retry-After稍后重试
     """
     username = request.form.get('username')
     email = request.form.get('email')
@@ -3662,6 +6709,14 @@ def user_register(app_id):
                 'email': user.email
             }
         })
+    except (PasswordHasherBusy, concurrent.futures.TimeoutError):
+        db.session.rollback()
+        response = jsonify({
+            'status': 'error',
+            'message': '注册请求过多，请稍后再试'
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 503
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"注册失败: {str(e)}")
@@ -3707,15 +6762,32 @@ def view_report(token):
     ).limit(30).all()
     
     # 获取API调用统计（只统计前20个最频繁的API）
+    # 原始日志与已压缩的旧日志合并统计
+    endpoint_counts = db.union_all(
+        db.select(
+            ApiCallLog.endpoint,
+            db.func.count(ApiCallLog.id).label('count')
+        ).filter(
+            ApiCallLog.user_id == report.user_id
+        ).group_by(
+            ApiCallLog.endpoint
+        ),
+        db.select(
+            ApiCallSummary.endpoint,
+            db.func.sum(ApiCallSummary.count).label('count')
+        ).filter(
+            ApiCallSummary.user_id == report.user_id
+        ).group_by(
+            ApiCallSummary.endpoint
+        )
+    ).subquery()
     api_stats = db.session.query(
-        ApiCallLog.endpoint,
-        db.func.count(ApiCallLog.id).label('count')
-    ).filter(
-        ApiCallLog.user_id == report.user_id
+        endpoint_counts.c.endpoint,
+        db.cast(db.func.sum(endpoint_counts.c.count), db.Integer).label('count')
     ).group_by(
-        ApiCallLog.endpoint
+        endpoint_counts.c.endpoint
     ).order_by(
-        db.func.count(ApiCallLog.id).desc()
+        db.func.sum(endpoint_counts.c.count).desc()
     ).limit(20).all()
     
     # 获取卡密统计（按项目分组，限制30个项目）
@@ -3760,6 +6832,337 @@ def view_report(token):
                          expires_at=report.expires_at,
                          now=datetime.now)
 
+# 命令行工具
+@app.cli.command('stress-activate')
+@click.option('--database', default=None, help='测试用数据库地址，默认在临时目录新建SQLite数据库。不要指向生产数据库')
+@click.option('--threads', default=16, show_default=True, help='并发请求线程数')
+@click.option('--rounds', default=50, show_default=True, help='测试轮数，每轮所有线程同时激活同一个新卡密')
+def stress_activate(database, threads, rounds):
+    """在独立数据库中并发激活同一卡密的压力测试，输出吞吐量和重复激活次数"""
+    if 'api_v1' not in app.blueprints:
+        app.register_blueprint(api_v1)
+    
+    engine = db.create_engine(database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stress.db'))
+    db.metadata.create_all(engine)
+    # 测试期间请求处理中的数据库访问都落到测试库；请求都来自同一IP和同一app_id，关闭限流以免测到的是429
+    live_engine = db.engines[None]
+    rate_limit_enabled = app.config['RATE_LIMIT_ENABLED']
+    db.session.remove()
+    db.engines[None] = engine
+    app.config['RATE_LIMIT_ENABLED'] = False
+    try:
+        owner = User(username='stress-activate', email='stress-activate@example.com', password_hash='x')
+        db.session.add(owner)
+        db.session.flush()
+        project = Project(name='stress-activate', user_id=owner.id)
+        db.session.add(project)
+        db.session.flush()
+        keys = [generate_license_key(32) for _ in range(rounds)]
+        db.session.add_all(LicenseKey(key=key, project_id=project.id, duration_minutes=60) for key in keys)
+        db.session.commit()
+        app_id, dev_id = project.app_id, owner.dev_id
+        
+        barrier = threading.Barrier(threads)
+        lock = threading.Lock()
+        results = [[] for _ in range(rounds)]
+        
+        def worker():
+            client = app.test_client()
+            # 压测请求不写入API调用日志（日志由后台线程写入，测试结束后会落到正式数据库）
+            client.environ_base['skt.synthetic'] = True
+            for i, key in enumerate(keys):
+                barrier.wait()
+                response = client.post(f'/v1/api/licenses/{app_id}/activate', data={'dev_id': dev_id, 'key': key})
+                with lock:
+                    results[i].append(response.status_code)
+        
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        db.session.remove()
+        db.engines[None] = live_engine
+        app.config['RATE_LIMIT_ENABLED'] = rate_limit_enabled
+        engine.dispose()
+    
+    successes = [codes.count(200) for codes in results]
+    total = threads * rounds
+    click.echo(f'请求总数: {total}，耗时: {elapsed:.2f}s，吞吐量: {total / elapsed:.1f} req/s')
+    click.echo(f'激活成功: {sum(successes)}，未激活的轮次: {successes.count(0)}，'
+               f'重复激活的轮次: {sum(1 for n in successes if n > 1)}')
+    click.echo(f'失败响应: {sum(len(codes) - codes.count(200) - codes.count(403) for codes in results)}')
+
+@app.cli.command('import-licenses')
+@click.argument('app_id')
+@click.argument('file', type=click.File('r', encoding='utf-8-sig'))
+def import_licenses_command(app_id, file):
+    """从CSV文件导入卡密到指定项目，FILE为-时从标准输入读取"""
+    project = Project.query.filter_by(app_id=app_id).first()
+    if not project:
+        raise click.ClickException('项目不存在')
+    
+    def report_progress(result):
+        click.echo(f"已处理 {result['total']} 行，导入 {result['imported']} 个，失败 {result['failed']} 行", err=True)
+    
+    try:
+        result = import_license_keys(project, file, on_progress=report_progress)
+    except (ValueError, csv.Error) as e:
+        raise click.ClickException(f'CSV文件无效: {e}')
+    for error in result['errors']:
+        click.echo(f"第 {error['line']} 行 {error['key']}: {error['error']}", err=True)
+    if result['failed'] > len(result['errors']):
+        click.echo(f"另有 {result['failed'] - len(result['errors'])} 行错误未显示", err=True)
+    click.echo(f"共 {result['total']} 行，成功导入 {result['imported']} 个卡密，失败 {result['failed']} 行")
+
+@app.cli.command('benchmark-password-hash')
+@click.option('--requests', 'total', default=200, show_default=True, help='模拟的登录次数')
+@click.option('--concurrency', default=16, show_default=True, help='并发请求线程数')
+@click.option('--workers', default=None, type=int, help='进程池大小，默认使用PASSWORD_HASH_WORKERS')
+@click.option('--method', default=None, help='密码哈希参数，默认使用PROJECT_USER_HASH_METHOD')
+def benchmark_password_hash(total, concurrency, workers, method):
+    """对比在请求线程中和在进程池中校验密码的吞吐量，输出每秒登录数和每核每秒登录数"""
+    method = normalize_password_hash_method(method or app.config['PROJECT_USER_HASH_METHOD'])
+    workers = workers or app.config['PASSWORD_HASH_WORKERS'] or 1
+    password_hash = generate_password_hash('benchmark-password', method)
+    click.echo(f'哈希参数 {method}，{total} 次登录，{concurrency} 个并发线程，CPU核数 {os.cpu_count()}')
+    
+    def run(hasher):
+        pending = queue.Queue()
+        for _ in range(total):
+            pending.put(None)
+        
+        def worker():
+            while True:
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    return
+                hasher.verify(password_hash, 'benchmark-password', method)
+        
+        # 先完成一次校验，排除进程池启动时间
+        hasher.verify(password_hash, 'benchmark-password', method)
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return total / (time.perf_counter() - started)
+    
+    inline_rate = run(PasswordHasher(workers=0))
+    click.echo(f'请求线程内校验: {inline_rate:.1f} 次/秒')
+    
+    pool = PasswordHasher(workers=workers, max_pending=concurrency, queue_timeout=60, timeout=60)
+    try:
+        pool_rate = run(pool)
+    finally:
+        pool.shutdown()
+    click.echo(f'进程池校验（{workers} 个进程）: {pool_rate:.1f} 次/秒，每核 {pool_rate / workers:.1f} 次/秒')
+
+@app.cli.command('backfill-stats')
+@click.option('--batch-size', default=10000, show_default=True, help='每次从数据库读取的行数')
+@click.option('--settle-minutes', default=10, show_default=True,
+              help='只重建早于"当前时间减去该分钟数"所在小时的统计，之后的小时仍由在线写入器累加')
+@click.option('--rebuild-activations', is_flag=True,
+              help='同时按卡密当前的activation_time重建激活次数。卡密只保留最后一次激活时间，'
+                   '重置后再次激活等历史激活会丢失，只适合统计表为空的首次部署')
+def backfill_stats(batch_size, settle_minutes, rebuild_activations):
+    """
+    根据现有的API调用日志（含已压缩的部分）重建小时统计表中的API调用次数，激活次数默认保持不变。
+    在线服务会持续累加当前小时的统计，为避免与之冲突导致计数丢失或重复，
+    只重建截止小时之前的行，截止小时及之后的统计保持不变；
+    若API日志写入队列积压超过--settle-minutes，请先停止服务或调大该值再执行
+    """
+    now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+    cutoff = truncate_to_hour(now - timedelta(minutes=settle_minutes))
+    # ApiCallLog.called_at和ApiCallSummary.hour是UTC时间
+    cutoff_utc = pytz.timezone('Asia/Shanghai').localize(cutoff).astimezone(pytz.UTC).replace(tzinfo=None)
+    
+    api_calls = Counter()
+    for user_id, called_at in db.session.query(ApiCallLog.user_id, ApiCallLog.called_at)\
+            .filter(ApiCallLog.called_at.isnot(None), ApiCallLog.called_at < cutoff_utc)\
+            .yield_per(batch_size):
+        api_calls[(user_id, truncate_to_hour(utc_to_beijing(called_at)))] += 1
+    # 已压缩的旧日志按小时计数累加
+    for user_id, hour, count in db.session.query(ApiCallSummary.user_id, ApiCallSummary.hour, ApiCallSummary.count)\
+            .filter(ApiCallSummary.hour < cutoff_utc)\
+            .yield_per(batch_size):
+        api_calls[(user_id, utc_to_beijing(hour))] += count
+    
+    if not rebuild_activations:
+        # 只替换API调用次数：先清零，再按小时累加，已有的激活次数不受影响
+        db.session.query(HourlyStat).filter(HourlyStat.hour < cutoff)\
+            .update({HourlyStat.api_calls: 0}, synchronize_session=False)
+        items = list(api_calls.items())
+        for start in range(0, len(items), batch_size):
+            increment_hourly_stats('api_calls', dict(items[start:start + batch_size]))
+        db.session.commit()
+        click.echo(f'已重建 {cutoff:%Y-%m-%d %H:00} 之前的 {len(items)} 条小时统计的API调用次数，共 {sum(api_calls.values())} 次')
+        return
+    
+    activations = Counter()
+    for user_id, activation_time in db.session.query(Project.user_id, LicenseKey.activation_time)\
+            .join(Project, LicenseKey.project_id == Project.id)\
+            .filter(LicenseKey.activation_time.isnot(None), LicenseKey.activation_time < cutoff)\
+            .yield_per(batch_size):
+        activations[(user_id, truncate_to_hour(activation_time))] += 1
+    
+    rows = [
+        {
+            'user_id': user_id,
+            'hour': hour,
+            'api_calls': api_calls.get((user_id, hour), 0),
+            'activations': activations.get((user_id, hour), 0)
+        }
+        for user_id, hour in set(api_calls) | set(activations)
+    ]
+    db.session.query(HourlyStat).filter(HourlyStat.hour < cutoff).delete(synchronize_session=False)
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(db.insert(HourlyStat), rows[start:start + batch_size])
+    db.session.commit()
+    click.echo(f'已重建 {cutoff:%Y-%m-%d %H:00} 之前的 {len(rows)} 条小时统计：API调用 {sum(api_calls.values())} 次，卡密激活 {sum(activations.values())} 次')
+
+@app.cli.command('compact-api-logs')
+def compact_api_logs_command():
+    """立即压缩超过保留期的API调用日志"""
+    click.echo(f'已压缩 {compact_api_call_logs()} 条API调用日志')
+
+@app.cli.command('expire-licenses')
+def expire_licenses_command():
+    """立即将已过期的激活卡密标记为未激活"""
+    click.echo(f'已标记 {expire_license_keys()} 个过期卡密')
+
+HOT_PATH_INDEXES = [
+    'ix_license_key_project_id_key',
+    'ix_license_key_project_id_is_active_expiry_time',
+    'ix_license_key_is_active_expiry_time',
+    'ix_project_user_project_id_username',
+    'ix_project_user_project_id_email',
+    'ix_project_user_project_id_uid',
+    'ix_project_user_reset_token',
+    'ix_api_call_log_user_id_called_at',
+    'ix_api_call_log_user_id_endpoint',
+]
+
+@app.cli.command('explain-hot-paths')
+@click.option('--database', default=None, help='测试用数据库地址，默认在临时目录新建SQLite数据库。不要指向生产数据库')
+@click.option('--projects', default=50, show_default=True, help='生成的项目数')
+@click.option('--licenses', default=200000, show_default=True, help='生成的卡密数')
+@click.option('--users', default=50000, show_default=True, help='生成的项目用户数')
+@click.option('--api-calls', default=500000, show_default=True, help='生成的API调用日志数')
+@click.option('--repeat', default=20, show_default=True, help='每条查询计时的执行次数')
+def explain_hot_paths(database, projects, licenses, users, api_calls, repeat):
+    """在独立数据库中生成大量数据，输出各/v1/api热点查询在添加索引前后的执行计划和耗时"""
+    engine = db.create_engine(database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'explain.db'))
+    db.metadata.create_all(engine)
+    indexes = [
+        index
+        for model in (LicenseKey, ProjectUser, ApiCallLog)
+        for index in model.__table__.indexes
+        if index.name in HOT_PATH_INDEXES
+    ]
+    for index in indexes:
+        index.drop(engine, checkfirst=True)
+    
+    click.echo(f'生成测试数据：{projects} 个项目，{licenses} 个卡密，{users} 个用户，{api_calls} 条API调用日志')
+    now = datetime.now(pytz.timezone('Asia/Shanghai')).replace(tzinfo=None)
+    chunk = 10000
+    
+    def insert_chunked(table, count, make_row):
+        with engine.begin() as connection:
+            for start in range(0, count, chunk):
+                connection.execute(db.insert(table), [make_row(i) for i in range(start, min(start + chunk, count))])
+    
+    insert_chunked(User.__table__, 1, lambda i: {
+        'dev_id': str(uuid.uuid4()), 'uid': f'EXPLAIN{i:05d}', 'username': f'explain{i}',
+        'email': f'explain{i}@example.com', 'password_hash': 'x'
+    })
+    insert_chunked(Project.__table__, projects, lambda i: {
+        'app_id': str(uuid.uuid4()), 'name': f'project-{i}', 'user_id': 1, 'created_at': now
+    })
+    insert_chunked(LicenseKey.__table__, licenses, lambda i: {
+        'key': f'K{i:015d}', 'project_id': i % projects + 1, 'duration_minutes': 1440,
+        'is_active': i % 5 != 0, 'is_banned': False, 'created_at': now,
+        'activation_time': now - timedelta(days=i % 60) if i % 2 else None,
+        'expiry_time': now - timedelta(days=i % 60) + timedelta(days=1) if i % 2 else None
+    })
+    insert_chunked(ProjectUser.__table__, users, lambda i: {
+        'uid': f'{i:012d}', 'project_id': i % projects + 1, 'username': f'user{i}', 'email': f'user{i}@example.com',
+        'password_hash': 'x', 'created_at': now, 'reset_token': str(uuid.uuid4()) if i % 10 == 0 else None
+    })
+    insert_chunked(ApiCallLog.__table__, api_calls, lambda i: {
+        'user_id': 1, 'endpoint': f'/v1/api/licenses/{i % projects}/alldata',
+        'called_at': now - timedelta(minutes=i % (60 * 24 * 30)), 'ip_address': '127.0.0.1'
+    })
+    
+    with engine.connect() as connection:
+        app_id = connection.execute(db.select(Project.app_id).where(Project.id == projects // 2 + 1)).scalar()
+        reset_token = connection.execute(
+            db.select(ProjectUser.reset_token).where(ProjectUser.reset_token.isnot(None)).limit(1)
+        ).scalar()
+    project_id = projects // 2 + 1
+    sample = licenses // 2 - (licenses // 2) % projects + project_id - 1
+    user_sample = users // 2 - (users // 2) % projects + project_id - 1
+    
+    queries = [
+        ('projects/<app_id> 项目信息', db.select(Project).where(Project.app_id == app_id)),
+        ('dev_id 鉴权', db.select(Project.id, Project.name, Project.user_id, User.dev_id)
+            .join(User, Project.user_id == User.id).where(Project.app_id == app_id)),
+        ('licenses/* (project_id, key)', db.select(LicenseKey)
+            .where(LicenseKey.project_id == project_id, LicenseKey.key == f'K{sample:015d}')),
+        ('project-users/* (project_id, username)', db.select(ProjectUser)
+            .where(ProjectUser.project_id == project_id, ProjectUser.username == f'user{user_sample}')),
+        ('project-users/* (project_id, email)', db.select(ProjectUser)
+            .where(ProjectUser.project_id == project_id, ProjectUser.email == f'user{user_sample}@example.com')),
+        ('project-users/* (project_id, uid)', db.select(ProjectUser)
+            .where(ProjectUser.project_id == project_id, ProjectUser.uid == f'{user_sample:012d}')),
+        ('project-user-reset (reset_token)', db.select(ProjectUser).where(ProjectUser.reset_token == reset_token)),
+        ('API调用统计 (user_id, called_at)', db.select(db.func.count(ApiCallLog.id))
+            .where(ApiCallLog.user_id == 1, ApiCallLog.called_at >= now - timedelta(days=1))),
+        ('报告接口排行 (user_id, endpoint)', db.select(ApiCallLog.endpoint, db.func.count(ApiCallLog.id))
+            .where(ApiCallLog.user_id == 1).group_by(ApiCallLog.endpoint)),
+        ('有效卡密统计 (project_id, is_active, expiry_time)', db.select(db.func.count(LicenseKey.id))
+            .where(LicenseKey.project_id == project_id, LicenseKey.is_active == True, LicenseKey.expiry_time > now)),
+        ('过期卡密清理 (is_active, expiry_time)', db.select(LicenseKey.id)
+            .where(LicenseKey.is_active == True, LicenseKey.expiry_time < now)
+            .order_by(LicenseKey.expiry_time).limit(1000)),
+    ]
+    explain_prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    
+    def measure(title):
+        click.echo(f'\n===== {title} =====')
+        timings = {}
+        with engine.connect() as connection:
+            for name, statement in queries:
+                compiled = statement.compile(engine)
+                params = tuple(compiled.params[key] for key in compiled.positiontup) if compiled.positional else compiled.params
+                plan = connection.exec_driver_sql(explain_prefix + str(compiled), params).fetchall()
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    connection.execute(statement).fetchall()
+                timings[name] = (time.perf_counter() - started) * 1000 / repeat
+                click.echo(f'{name}: {timings[name]:.3f} ms')
+                for row in plan:
+                    click.echo('    ' + ' | '.join(str(value) for value in row))
+        return timings
+    
+    before = measure('添加索引前')
+    for index in indexes:
+        index.create(engine)
+    if engine.dialect.name == 'sqlite':
+        with engine.begin() as connection:
+            connection.exec_driver_sql('ANALYZE')
+    after = measure('添加索引后')
+    
+    click.echo('\n===== 耗时对比 =====')
+    for name, _ in queries:
+        click.echo(f'{name}: {before[name]:.3f} ms -> {after[name]:.3f} ms')
+    engine.dispose()
+
 # 错误处理
 @app.errorhandler(404)
 def page_not_found(e):
@@ -3779,9 +7182,18 @@ if __name__ == '__main__':
         db.create_all()
         create_default_admin()
         update_existing_users_uid()
+        fail_interrupted_license_generation_jobs()
+        resume_interrupted_email_campaigns()
+    # 发送上次运行时未发完的邮件
+    email_queue.start()
     os.makedirs(os.path.join(app.root_path, 'static', 'uploads'), exist_ok=True)
     app.register_blueprint(api_v1)
     scheduler = BackgroundScheduler()
     scheduler.add_job(func=cleanup_expired_reports, trigger="interval", minutes=5)
+    scheduler.add_job(func=compact_api_call_logs, trigger="interval", minutes=app.config['API_LOG_COMPACT_INTERVAL'])
+    scheduler.add_job(func=expire_license_keys, trigger="interval", minutes=app.config['LICENSE_EXPIRY_SWEEP_INTERVAL'])
+    scheduler.add_job(func=purge_token_revocations, trigger="interval", minutes=60)
+    scheduler.add_job(func=purge_outbound_emails, trigger="interval", minutes=60)
+    scheduler.add_job(func=resume_interrupted_email_campaigns, trigger="interval", seconds=app.config['MAIL_CAMPAIGN_STALE_TIMEOUT'])
     scheduler.start()
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -27,4 +27,85 @@ class Config:
     APP_NAME = 'SimpleKeytime' # 网站名
     APP_DESCRIPTION = '简单易用的软件授权管理系统' # 描述
     APP_URL = os.getenv('APP_URL', 'http://localhost:5000') # 变量调用的站点地址
-    APP_PORT = 5000
\ No newline at end of file
+    APP_PORT = 5000
+
+    # 邮件发送队列配置
+    MAIL_QUEUE_POLL_INTERVAL = 5  # 后台发送线程检查待发送邮件的间隔（秒），新邮件入队时立即唤醒
+    MAIL_QUEUE_BATCH_SIZE = 50  # 每次从数据库领取的待发送邮件数量
+    MAIL_CONNECTION_IDLE_TIMEOUT = 30  # SMTP连接空闲超过该秒数后断开，期间发送的邮件复用同一连接
+    MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))  # 单封邮件最多尝试发送的次数，超过后标记为失败
+    MAIL_RETRY_BACKOFF = 30  # 首次重试前等待的秒数，之后每次翻倍
+    MAIL_RETRY_MAX_BACKOFF = 3600  # 重试等待的最长秒数
+    MAIL_SENDING_TIMEOUT = 600  # 领取后超过该秒数仍未完成（如进程退出）的邮件重新发送
+    MAIL_RETENTION_DAYS = int(os.getenv('MAIL_RETENTION_DAYS', 7))  # 已发送和发送失败的邮件记录保留天数
+
+    # 公告群发配置
+    MAIL_CAMPAIGN_CHUNK_SIZE = 500  # 群发公告时每批从数据库读取的收件人数量
+    MAIL_CAMPAIGN_RATE = float(os.getenv('MAIL_CAMPAIGN_RATE', 10))  # 群发公告每秒最多发送的邮件数，0表示不限速
+    MAIL_CAMPAIGN_STALE_TIMEOUT = 300  # 发送中的群发任务超过该秒数没有心跳时视为中断，由其他进程或重启后的服务接手
+
+    # 缓存配置
+    PROJECT_CACHE_SIZE = int(os.getenv('PROJECT_CACHE_SIZE', 1024))  # 项目信息缓存的最大条目数
+    PROJECT_CACHE_TTL = int(os.getenv('PROJECT_CACHE_TTL', 60))  # 项目信息缓存有效期（秒）
+    # 开发者DevID鉴权结果缓存有效期（秒）。缓存在各进程内，重置DevID或删除项目时只清除当前进程的缓存，
+    # 其他工作进程最多在该时间内仍接受旧的DevID/AppID，因此保持较短；设为0关闭缓存
+    PROJECT_AUTH_CACHE_TTL = int(os.getenv('PROJECT_AUTH_CACHE_TTL', 5))
+    PROJECT_HTTP_MAX_AGE = int(os.getenv('PROJECT_HTTP_MAX_AGE', 60))  # 项目信息接口的Cache-Control max-age（秒）
+
+    # 卡密接口配置
+    LICENSE_BATCH_MAX_KEYS = int(os.getenv('LICENSE_BATCH_MAX_KEYS', 10000))  # 批量查询卡密单次请求的最大数量
+    LICENSE_BATCH_CHUNK_SIZE = 500  # 批量查询时每条IN查询包含的卡密数量
+    LICENSE_TOKEN_TTL = int(os.getenv('LICENSE_TOKEN_TTL', 7 * 24 * 3600))  # 离线卡密令牌的最长有效期（秒），到期后客户端需重新获取
+    LICENSE_GENERATION_MAX_KEYS = 1000000  # 单次生成卡密的最大数量
+    LICENSE_GENERATION_SYNC_LIMIT = 1000  # 不超过该数量时在请求内直接生成，超过时转为后台任务
+    LICENSE_GENERATION_CHUNK_SIZE = 5000  # 生成卡密时每批插入并提交的数量
+    LICENSE_EXPORT_YIELD_PER = 1000  # 导出卡密时每次从数据库游标读取的行数
+    LICENSE_IMPORT_CHUNK_SIZE = 1000  # 导入卡密时每批校验并插入的行数
+    LICENSE_IMPORT_MAX_ERRORS = 1000  # 导入结果中最多返回的错误行数，超出部分只计数
+    LICENSE_PAGE_SIZE = int(os.getenv('LICENSE_PAGE_SIZE', 50))  # 卡密列表默认每页条数
+    LICENSE_PAGE_SIZES = [20, 50, 100, 200]  # 卡密列表可选的每页条数
+
+    # 项目用户管理配置
+    PROJECT_USER_PAGE_SIZE = int(os.getenv('PROJECT_USER_PAGE_SIZE', 50))  # 项目用户列表默认每页条数
+    PROJECT_USER_PAGE_SIZES = [20, 50, 100, 200]  # 项目用户列表可选的每页条数
+
+    # 项目用户会话令牌配置
+    PROJECT_USER_TOKEN_TTL = int(os.getenv('PROJECT_USER_TOKEN_TTL', 3600))  # 登录后签发的访问令牌有效期（秒）
+    PROJECT_USER_REFRESH_TOKEN_TTL = int(os.getenv('PROJECT_USER_REFRESH_TOKEN_TTL', 30 * 24 * 3600))  # 刷新令牌有效期（秒）
+    PROJECT_USER_DENYLIST_REFRESH = int(os.getenv('PROJECT_USER_DENYLIST_REFRESH', 30))  # 令牌吊销名单从数据库重新加载的间隔（秒）
+
+    # 密码哈希配置
+    PROJECT_USER_HASH_METHOD = os.getenv('PROJECT_USER_HASH_METHOD', 'scrypt:32768:8:1')  # 项目未单独设置时使用的项目用户密码哈希参数
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))  # 每个应用进程计算密码哈希的子进程数，0表示在请求线程中计算；gunicorn多进程部署时总数为工作进程数乘以该值
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 64))  # 同时提交到进程池的最大任务数
+    PASSWORD_HASH_QUEUE_TIMEOUT = 2  # 进程池满时最多等待的秒数，超时返回503
+    PASSWORD_HASH_TIMEOUT = 10  # 单次哈希计算的最长等待秒数
+
+    # API限流配置
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'false').lower() == 'true'  # 是否对/v1/api启用令牌桶限流，部署在反向代理之后时需同时设置PROXY_FIX_X_FOR
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')  # memory为进程内计数，sqlite为多个工作进程共享计数
+    RATE_LIMIT_SQLITE_PATH = os.getenv('RATE_LIMIT_SQLITE_PATH', 'ratelimit.db')  # sqlite后端的数据库文件，相对路径位于instance目录
+    PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', 0))  # 应用之前的反向代理层数（如只有Nginx为1），大于0时按X-Forwarded-For确定客户端IP；直接对外服务时保持0，避免客户端伪造IP
+    RATE_LIMIT_MAX_KEYS = 100000  # memory后端最多保留的令牌桶数量，超出时淘汰最久未使用的
+    # 每组接口的限流规则：(桶容量, 秒)，即每个IP或每个app_id最多突发“桶容量”次请求，每“秒”恢复“桶容量”次
+    RATE_LIMITS = {
+        'projects': {'ip': (120, 60), 'app_id': (6000, 60)},
+        'licenses': {'ip': (60, 60), 'app_id': (3000, 60)},
+        'project-users': {'ip': (60, 60), 'app_id': (3000, 60)},
+        'auth': {'ip': (10, 60), 'app_id': (600, 60)},  # 登录、注册、刷新令牌和发送重置邮件
+    }
+
+    # API调用日志配置
+    API_LOG_QUEUE_SIZE = int(os.getenv('API_LOG_QUEUE_SIZE', 10000))  # 内存队列容量，队列满时丢弃新日志
+    API_LOG_BATCH_SIZE = int(os.getenv('API_LOG_BATCH_SIZE', 500))  # 每次批量写入的最大条数
+    API_LOG_FLUSH_INTERVAL = float(os.getenv('API_LOG_FLUSH_INTERVAL', 0.5))  # 批量写入间隔（秒）
+    API_LOG_RETENTION_DAYS = int(os.getenv('API_LOG_RETENTION_DAYS', 30))  # 原始日志保留天数，超过后压缩为按小时的计数，0表示不压缩
+    API_LOG_COMPACT_INTERVAL = int(os.getenv('API_LOG_COMPACT_INTERVAL', 60))  # 日志压缩任务的执行间隔（分钟）
+    API_LOG_COMPACT_BATCH_SIZE = 1000  # 日志压缩每批处理的行数
+    API_LOG_COMPACT_MAX_BATCHES = 100  # 日志压缩单次运行最多处理的批数
+    API_STATS_SOURCE = os.getenv('API_STATS_SOURCE', 'rollup')  # 控制台图表数据来源：rollup为小时统计表，raw为直接聚合原始表
+
+    # 卡密过期清理配置
+    LICENSE_EXPIRY_SWEEP_INTERVAL = int(os.getenv('LICENSE_EXPIRY_SWEEP_INTERVAL', 1))  # 过期卡密清理任务的执行间隔（分钟）
+    LICENSE_EXPIRY_SWEEP_BATCH_SIZE = 1000  # 过期卡密清理每批更新的行数
+    LICENSE_EXPIRY_SWEEP_MAX_BATCHES = 100  # 过期卡密清理单次运行最多处理的批数
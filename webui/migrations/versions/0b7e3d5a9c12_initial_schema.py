@@ -0,0 +1,146 @@
+"""initial schema
+
+Revision ID: 0b7e3d5a9c12
+Revises: 
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b7e3d5a9c12'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def has_table(table):
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade():
+    # 引入迁移之前的表结构，后续迁移在此基础上添加索引、列和新表；
+    # 数据库可能由 db.create_all() 创建，表已存在时跳过
+    if not has_table('user'):
+        op.create_table(
+            'user',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('dev_id', sa.String(length=36), nullable=True),
+            sa.Column('uid', sa.String(length=12), nullable=True),
+            sa.Column('username', sa.String(length=50), nullable=False),
+            sa.Column('email', sa.String(length=100), nullable=False),
+            sa.Column('password_hash', sa.String(length=128), nullable=False),
+            sa.Column('nickname', sa.String(length=50), nullable=True),
+            sa.Column('avatar', sa.String(length=255), nullable=True),
+            sa.Column('email_verified', sa.Boolean(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('last_login', sa.DateTime(), nullable=True),
+            sa.Column('last_login_ip', sa.String(length=45), nullable=True),
+            sa.Column('is_admin', sa.Boolean(), nullable=True),
+            sa.Column('reset_code', sa.String(length=6), nullable=True),
+            sa.Column('reset_code_expires', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('dev_id'),
+            sa.UniqueConstraint('uid'),
+            sa.UniqueConstraint('username'),
+            sa.UniqueConstraint('email')
+        )
+    if not has_table('announcement'):
+        op.create_table(
+            'announcement',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(length=100), nullable=False),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if not has_table('project'):
+        op.create_table(
+            'project',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('app_id', sa.String(length=36), nullable=True),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('description', sa.Text(), nullable=True),
+            sa.Column('latest_version', sa.String(length=50), nullable=True),
+            sa.Column('download_url', sa.String(length=255), nullable=True),
+            sa.Column('announcement', sa.Text(), nullable=True),
+            sa.Column('force_update', sa.Boolean(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('app_id')
+        )
+    if not has_table('license_key'):
+        op.create_table(
+            'license_key',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('key', sa.String(length=64), nullable=False),
+            sa.Column('project_id', sa.Integer(), nullable=False),
+            sa.Column('duration_minutes', sa.Integer(), nullable=False),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+            sa.Column('is_banned', sa.Boolean(), nullable=True),
+            sa.Column('activation_time', sa.DateTime(), nullable=True),
+            sa.Column('expiry_time', sa.DateTime(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('notes', sa.Text(), nullable=True),
+            sa.ForeignKeyConstraint(['project_id'], ['project.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('key')
+        )
+    if not has_table('project_user'):
+        op.create_table(
+            'project_user',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('uid', sa.String(length=12), nullable=False),
+            sa.Column('project_id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(length=50), nullable=False),
+            sa.Column('email', sa.String(length=100), nullable=False),
+            sa.Column('password_hash', sa.String(length=128), nullable=False),
+            sa.Column('nickname', sa.String(length=50), nullable=True),
+            sa.Column('signature', sa.String(length=200), nullable=True),
+            sa.Column('avatar', sa.String(length=255), nullable=True),
+            sa.Column('is_active', sa.Boolean(), nullable=True),
+            sa.Column('is_banned', sa.Boolean(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('last_login', sa.DateTime(), nullable=True),
+            sa.Column('last_login_ip', sa.String(length=45), nullable=True),
+            sa.Column('reset_token', sa.String(length=64), nullable=True),
+            sa.Column('reset_token_expires', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['project_id'], ['project.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('uid')
+        )
+    if not has_table('api_call_log'):
+        op.create_table(
+            'api_call_log',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('endpoint', sa.String(length=100), nullable=False),
+            sa.Column('called_at', sa.DateTime(), nullable=True),
+            sa.Column('ip_address', sa.String(length=45), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if not has_table('report'):
+        op.create_table(
+            'report',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('token', sa.String(length=64), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('token')
+        )
+
+
+def downgrade():
+    for table in ['report', 'api_call_log', 'project_user', 'license_key', 'project', 'announcement', 'user']:
+        if has_table(table):
+            op.drop_table(table)
@@ -0,0 +1,40 @@
+"""add per-project password hash method and widen project user hashes
+
+Revision ID: 2a7f5e9c8d61
+Revises: 9e6b1f4c3a27
+Create Date: 2026-10-18 19:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2a7f5e9c8d61'
+down_revision = '9e6b1f4c3a27'
+branch_labels = None
+depends_on = None
+
+
+def existing_columns(table):
+    inspector = sa.inspect(op.get_bind())
+    return {column['name']: column for column in inspector.get_columns(table)}
+
+
+def upgrade():
+    # 数据库可能由 db.create_all() 创建，列已存在时跳过
+    if 'password_hash_method' not in existing_columns('project'):
+        op.add_column('project', sa.Column('password_hash_method', sa.String(length=50), nullable=True))
+    
+    # scrypt哈希超过128个字符
+    password_hash = existing_columns('project_user')['password_hash']
+    if getattr(password_hash['type'], 'length', None) and password_hash['type'].length < 255:
+        with op.batch_alter_table('project_user') as batch_op:
+            batch_op.alter_column('password_hash', existing_type=sa.String(length=128),
+                                  type_=sa.String(length=255), existing_nullable=False)
+
+
+def downgrade():
+    if 'password_hash_method' in existing_columns('project'):
+        with op.batch_alter_table('project') as batch_op:
+            batch_op.drop_column('password_hash_method')
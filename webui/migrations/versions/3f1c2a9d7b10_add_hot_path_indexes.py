@@ -0,0 +1,50 @@
+"""add composite indexes for hot lookup paths
+
+Revision ID: 3f1c2a9d7b10
+Revises: 0b7e3d5a9c12
+Create Date: 2026-10-18 15:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b10'
+down_revision = '0b7e3d5a9c12'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_license_key_project_id_key', 'license_key', ['project_id', 'key']),
+    ('ix_license_key_project_id_is_active_expiry_time', 'license_key', ['project_id', 'is_active', 'expiry_time']),
+    ('ix_project_user_project_id_username', 'project_user', ['project_id', 'username']),
+    ('ix_project_user_project_id_email', 'project_user', ['project_id', 'email']),
+    ('ix_project_user_project_id_uid', 'project_user', ['project_id', 'uid']),
+    ('ix_project_user_reset_token', 'project_user', ['reset_token']),
+    ('ix_api_call_log_user_id_called_at', 'api_call_log', ['user_id', 'called_at']),
+    ('ix_api_call_log_user_id_endpoint', 'api_call_log', ['user_id', 'endpoint']),
+]
+
+
+def existing_indexes(table):
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return None
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    # 数据库可能由 db.create_all() 创建，表和索引已存在时跳过
+    for name, table, columns in INDEXES:
+        indexes = existing_indexes(table)
+        if indexes is not None and name not in indexes:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in INDEXES:
+        indexes = existing_indexes(table)
+        if indexes is not None and name in indexes:
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,48 @@
+"""add email_campaign table
+
+Revision ID: 4b8d1e6a2c75
+Revises: e7f2b5c9a813
+Create Date: 2026-10-18 22:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8d1e6a2c75'
+down_revision = 'e7f2b5c9a813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 数据库可能由 db.create_all() 创建，表已存在时跳过
+    if sa.inspect(op.get_bind()).has_table('email_campaign'):
+        return
+    op.create_table(
+        'email_campaign',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('subject', sa.String(length=255), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('search', sa.String(length=100), nullable=True),
+        sa.Column('user_status', sa.String(length=20), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('sent', sa.Integer(), nullable=False),
+        sa.Column('failed', sa.Integer(), nullable=False),
+        sa.Column('last_user_id', sa.Integer(), nullable=False),
+        sa.Column('error', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['project_id'], ['project.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('email_campaign'):
+        op.drop_table('email_campaign')
@@ -0,0 +1,43 @@
+"""add index for paginated license listing
+
+Revision ID: 5d9a3c7e2f14
+Revises: c41d7e2b9f58
+Create Date: 2026-10-18 18:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d9a3c7e2f14'
+down_revision = 'c41d7e2b9f58'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_license_key_project_id_created_at', 'license_key', ['project_id', 'created_at']),
+]
+
+
+def existing_indexes(table):
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return None
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    # 数据库可能由 db.create_all() 创建，表和索引已存在时跳过
+    for name, table, columns in INDEXES:
+        indexes = existing_indexes(table)
+        if indexes is not None and name not in indexes:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in INDEXES:
+        indexes = existing_indexes(table)
+        if indexes is not None and name in indexes:
+            op.drop_index(name, table_name=table)
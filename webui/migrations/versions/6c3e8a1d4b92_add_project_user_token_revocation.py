@@ -0,0 +1,38 @@
+"""add project_user_token_revocation table
+
+Revision ID: 6c3e8a1d4b92
+Revises: 2a7f5e9c8d61
+Create Date: 2026-10-18 20:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c3e8a1d4b92'
+down_revision = '2a7f5e9c8d61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 数据库可能由 db.create_all() 创建，表已存在时跳过
+    if sa.inspect(op.get_bind()).has_table('project_user_token_revocation'):
+        return
+    op.create_table(
+        'project_user_token_revocation',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('jti', sa.String(length=32), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_project_user_token_revocation_jti', 'project_user_token_revocation', ['jti'])
+    op.create_index('ix_project_user_token_revocation_expires_at', 'project_user_token_revocation', ['expires_at'])
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('project_user_token_revocation'):
+        op.drop_table('project_user_token_revocation')
@@ -0,0 +1,54 @@
+"""add hourly_stat and api_call_summary tables
+
+Revision ID: 7d1f4b8e2a60
+Revises: a5c2f8e1d937
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d1f4b8e2a60'
+down_revision = 'a5c2f8e1d937'
+branch_labels = None
+depends_on = None
+
+
+def has_table(table):
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade():
+    # 数据库可能由 db.create_all() 创建，表已存在时跳过
+    if not has_table('hourly_stat'):
+        op.create_table(
+            'hourly_stat',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('hour', sa.DateTime(), nullable=False),
+            sa.Column('api_calls', sa.Integer(), nullable=False),
+            sa.Column('activations', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'hour', name='uq_hourly_stat_user_hour')
+        )
+    if not has_table('api_call_summary'):
+        op.create_table(
+            'api_call_summary',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('endpoint', sa.String(length=100), nullable=False),
+            sa.Column('hour', sa.DateTime(), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'endpoint', 'hour', name='uq_api_call_summary_user_endpoint_hour')
+        )
+
+
+def downgrade():
+    for table in ['api_call_summary', 'hourly_stat']:
+        if has_table(table):
+            op.drop_table(table)
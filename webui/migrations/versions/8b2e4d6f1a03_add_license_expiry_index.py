@@ -0,0 +1,43 @@
+"""add index for the license expiry sweeper
+
+Revision ID: 8b2e4d6f1a03
+Revises: 3f1c2a9d7b10
+Create Date: 2026-10-18 16:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6f1a03'
+down_revision = '3f1c2a9d7b10'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_license_key_is_active_expiry_time', 'license_key', ['is_active', 'expiry_time']),
+]
+
+
+def existing_indexes(table):
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return None
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    # 数据库可能由 db.create_all() 创建，表和索引已存在时跳过
+    for name, table, columns in INDEXES:
+        indexes = existing_indexes(table)
+        if indexes is not None and name not in indexes:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in INDEXES:
+        indexes = existing_indexes(table)
+        if indexes is not None and name in indexes:
+            op.drop_index(name, table_name=table)
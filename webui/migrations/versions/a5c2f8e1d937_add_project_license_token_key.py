@@ -0,0 +1,40 @@
+"""add per-project Ed25519 key for offline license tokens
+
+Revision ID: a5c2f8e1d937
+Revises: 4b8d1e6a2c75
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+import base64
+
+from alembic import op
+import sqlalchemy as sa
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5c2f8e1d937'
+down_revision = '4b8d1e6a2c75'
+branch_labels = None
+depends_on = None
+
+
+def generate_key():
+    return base64.urlsafe_b64encode(Ed25519PrivateKey.generate().private_bytes_raw()).rstrip(b'=').decode('ascii')
+
+
+def upgrade():
+    bind = op.get_bind()
+    # 数据库可能由 db.create_all() 创建，列已存在时跳过
+    if 'license_token_key' not in {column['name'] for column in sa.inspect(bind).get_columns('project')}:
+        op.add_column('project', sa.Column('license_token_key', sa.String(length=64), nullable=True))
+    
+    # 为已有项目生成签名密钥
+    project = sa.table('project', sa.column('id', sa.Integer), sa.column('license_token_key', sa.String))
+    for (project_id,) in bind.execute(sa.select(project.c.id).where(project.c.license_token_key.is_(None))).fetchall():
+        bind.execute(project.update().where(project.c.id == project_id).values(license_token_key=generate_key()))
+
+
+def downgrade():
+    with op.batch_alter_table('project') as batch_op:
+        batch_op.drop_column('license_token_key')
@@ -0,0 +1,73 @@
+"""add project user session generation and unique revocation jti
+
+Revision ID: b3e9d2f7c140
+Revises: 7d1f4b8e2a60
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e9d2f7c140'
+down_revision = '7d1f4b8e2a60'
+branch_labels = None
+depends_on = None
+
+
+def existing_columns(table):
+    inspector = sa.inspect(op.get_bind())
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def existing_indexes(table):
+    inspector = sa.inspect(op.get_bind())
+    return {index['name']: index for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    # 数据库可能由 db.create_all() 创建，列和索引已存在时跳过
+    if 'session_generation' not in existing_columns('project_user'):
+        with op.batch_alter_table('project_user') as batch_op:
+            batch_op.add_column(sa.Column('session_generation', sa.Integer(), nullable=False, server_default='0'))
+    
+    if 'generation' not in existing_columns('project_user_token_revocation'):
+        op.add_column('project_user_token_revocation', sa.Column('generation', sa.Integer(), nullable=True))
+        # 旧的整用户吊销记录按签发时间判断，无法换算为代数：
+        # 把这些用户的会话代数设为1，未携带代数的旧令牌全部失效，用户需要重新登录
+        revocation = sa.table('project_user_token_revocation',
+                              sa.column('jti', sa.String), sa.column('user_id', sa.Integer),
+                              sa.column('generation', sa.Integer))
+        project_user = sa.table('project_user', sa.column('id', sa.Integer), sa.column('session_generation', sa.Integer))
+        op.execute(revocation.update().where(revocation.c.jti.is_(None)).values(generation=1))
+        op.execute(project_user.update().where(
+            project_user.c.id.in_(sa.select(revocation.c.user_id).where(revocation.c.jti.is_(None)))
+        ).values(session_generation=1))
+    
+    index = existing_indexes('project_user_token_revocation').get('ix_project_user_token_revocation_jti')
+    if index is None or not index['unique']:
+        # 同一jti只保留最早的一条记录
+        op.execute(
+            'DELETE FROM project_user_token_revocation WHERE jti IS NOT NULL AND id NOT IN '
+            '(SELECT id FROM (SELECT MIN(id) AS id FROM project_user_token_revocation '
+            'WHERE jti IS NOT NULL GROUP BY jti) AS first_revocation)'
+        )
+        if index is not None:
+            op.drop_index('ix_project_user_token_revocation_jti', table_name='project_user_token_revocation')
+        op.create_index('ix_project_user_token_revocation_jti', 'project_user_token_revocation', ['jti'], unique=True)
+
+
+def downgrade():
+    index = existing_indexes('project_user_token_revocation').get('ix_project_user_token_revocation_jti')
+    if index is not None and index['unique']:
+        op.drop_index('ix_project_user_token_revocation_jti', table_name='project_user_token_revocation')
+        op.create_index('ix_project_user_token_revocation_jti', 'project_user_token_revocation', ['jti'])
+    
+    if 'generation' in existing_columns('project_user_token_revocation'):
+        with op.batch_alter_table('project_user_token_revocation') as batch_op:
+            batch_op.drop_column('generation')
+    
+    if 'session_generation' in existing_columns('project_user'):
+        with op.batch_alter_table('project_user') as batch_op:
+            batch_op.drop_column('session_generation')
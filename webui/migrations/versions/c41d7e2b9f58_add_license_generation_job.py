@@ -0,0 +1,44 @@
+"""add license_generation_job table
+
+Revision ID: c41d7e2b9f58
+Revises: 8b2e4d6f1a03
+Create Date: 2026-10-18 17:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d7e2b9f58'
+down_revision = '8b2e4d6f1a03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 数据库可能由 db.create_all() 创建，表已存在时跳过
+    if sa.inspect(op.get_bind()).has_table('license_generation_job'):
+        return
+    op.create_table(
+        'license_generation_job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('project_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('generated', sa.Integer(), nullable=False),
+        sa.Column('duration_minutes', sa.Integer(), nullable=False),
+        sa.Column('notes', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('error', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['project_id'], ['project.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('license_generation_job'):
+        op.drop_table('license_generation_job')
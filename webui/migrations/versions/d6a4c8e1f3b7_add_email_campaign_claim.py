@@ -0,0 +1,39 @@
+"""add claim and heartbeat columns to email_campaign
+
+Revision ID: d6a4c8e1f3b7
+Revises: b3e9d2f7c140
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6a4c8e1f3b7'
+down_revision = 'b3e9d2f7c140'
+branch_labels = None
+depends_on = None
+
+
+def existing_columns(table):
+    inspector = sa.inspect(op.get_bind())
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade():
+    # 数据库可能由 db.create_all() 创建，列已存在时跳过
+    columns = existing_columns('email_campaign')
+    if 'claimed_by' not in columns:
+        op.add_column('email_campaign', sa.Column('claimed_by', sa.String(length=32), nullable=True))
+    if 'heartbeat_at' not in columns:
+        op.add_column('email_campaign', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    columns = existing_columns('email_campaign')
+    with op.batch_alter_table('email_campaign') as batch_op:
+        if 'heartbeat_at' in columns:
+            batch_op.drop_column('heartbeat_at')
+        if 'claimed_by' in columns:
+            batch_op.drop_column('claimed_by')
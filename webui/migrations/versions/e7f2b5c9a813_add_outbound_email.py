@@ -0,0 +1,43 @@
+"""add outbound_email table
+
+Revision ID: e7f2b5c9a813
+Revises: 6c3e8a1d4b92
+Create Date: 2026-10-18 21:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7f2b5c9a813'
+down_revision = '6c3e8a1d4b92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 数据库可能由 db.create_all() 创建，表已存在时跳过
+    if sa.inspect(op.get_bind()).has_table('outbound_email'):
+        return
+    op.create_table(
+        'outbound_email',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('category', sa.String(length=30), nullable=False),
+        sa.Column('recipient', sa.String(length=100), nullable=False),
+        sa.Column('subject', sa.String(length=255), nullable=False),
+        sa.Column('html', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbound_email_status_next_attempt_at', 'outbound_email', ['status', 'next_attempt_at'])
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('outbound_email'):
+        op.drop_table('outbound_email')
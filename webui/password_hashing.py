@@ -0,0 +1,20 @@
+# 项目用户密码哈希在进程池中执行的函数。
+# 进程池的子进程只需要导入本模块，不要在这里导入app（会在每个子进程中创建数据库引擎、读取配置和初始化全局对象）
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+@lru_cache(maxsize=32)
+def normalize_password_hash_method(method):
+    """把scrypt、pbkdf2:sha256等简写展开为完整参数，参数无效时抛出ValueError"""
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def verify_and_rehash_password(password_hash, password, method):
+    """在进程池中执行：校验密码，哈希参数与method不一致时顺带生成新哈希。返回(是否正确, 新哈希或None)"""
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if password_hash.split('$', 1)[0] != normalize_password_hash_method(method):
+        return True, generate_password_hash(password, method)
+    return True, None